@@ -0,0 +1,171 @@
+"""
+Batched, deduplicating queue for engagement actions
+
+Likes, follows, comments etc. are collected instead of being sent right away.
+Duplicate actions are merged and an action followed by its inverse on the same
+target (follow then unfollow) cancels out, so neither request is sent. The
+rest is signed in one pass and dispatched by priority through a rate limiter.
+"""
+import concurrent.futures
+import itertools
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .rate_limit import RateLimiter
+
+__all__ = ["ActionQueue", "ACTIONS"]
+
+# action: (endpoint template, payload field holding the target, family)
+ACTIONS = {
+    'like': ('media/{target}/like/', 'media_id', 'like'),
+    'unlike': ('media/{target}/unlike/', 'media_id', 'like'),
+    'save': ('media/{target}/save/', 'media_id', 'save'),
+    'unsave': ('media/{target}/unsave/', 'media_id', 'save'),
+    'follow': ('friendships/create/{target}/', 'user_id', 'follow'),
+    'unfollow': ('friendships/destroy/{target}/', 'user_id', 'follow'),
+    'block': ('friendships/block/{target}/', 'user_id', 'block'),
+    'unblock': ('friendships/unblock/{target}/', 'user_id', 'block'),
+    'comment': ('media/{target}/comment/', None, 'comment'),
+}
+
+
+class _Action:
+    __slots__ = ('action', 'target', 'priority', 'text', 'seq')
+
+    def __init__(self, action: str, target, priority: int, text: Optional[str], seq: int) -> None:
+        self.action = action
+        self.target = target
+        self.priority = priority
+        self.text = text
+        self.seq = seq
+
+    def __lt__(self, other: '_Action') -> bool:
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class ActionQueue:
+    """
+    Collect engagement actions and send only the ones that still matter
+
+    Args:
+        client: InstagramAPI Logged-in client
+        limiter: RateLimiter every request is paced by. Unpaced when None
+        workers: int Requests in flight at once
+
+    Example:
+        actions = ActionQueue(api, RateLimiter(rate=0.5, burst=5))
+        actions.enqueue('follow', user_id)
+        actions.enqueue('like', media_id, priority=10)
+        actions.enqueue('unfollow', user_id)  # cancels the follow
+        actions.flush()
+        print(actions.stats())
+    """
+
+    def __init__(self, client, limiter: Optional[RateLimiter] = None, workers: int = 4) -> None:
+        self.client = client
+        self.limiter = limiter
+        self.workers = workers
+        self._pending: Dict[Tuple, _Action] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+        self.enqueued = 0
+        self.merged = 0
+        self.cancelled = 0
+        self.issued = 0
+        self.failed = 0
+
+    def enqueue(self, action: str, target, priority: int = 0, text: Optional[str] = None) -> None:
+        """
+        Queue `action` on `target` (a media id or user id)
+
+        Args:
+            action: str One of ACTIONS
+            target: Media id for like/save/comment, user id for follow/block
+            priority: int Higher priorities are sent first
+            text: str Comment text, only for 'comment'
+        """
+        if action not in ACTIONS:
+            raise ValueError(f'Unknown action {action!r}, expected one of {list(ACTIONS)}')
+        if (action == 'comment') != (text is not None):
+            raise ValueError("text is required for 'comment' and only allowed there")
+
+        family = ACTIONS[action][2]
+        key = (family, str(target), text)
+        with self._lock:
+            self.enqueued += 1
+            queued = self._pending.get(key)
+            if queued is None:
+                self._pending[key] = _Action(action, target, priority, text, next(self._seq))
+            elif queued.action == action:
+                queued.priority = max(queued.priority, priority)
+                self.merged += 1
+            else:
+                # An action and its inverse: sending neither has the same effect
+                del self._pending[key]
+                self.cancelled += 2
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _payload(self, item: _Action) -> str:
+        data = {
+            '_uuid': self.client.uuid,
+            '_uid': self.client.username_id,
+            '_csrftoken': self.client.token,
+        }
+        field = ACTIONS[item.action][1]
+        if field is not None:
+            data[field] = item.target
+        if item.text is not None:
+            data['comment_text'] = item.text
+        return json.dumps(data)
+
+    def _send(self, item: _Action, signed: str) -> bool:
+        if self.limiter is not None:
+            self.limiter.acquire()
+        endpoint = ACTIONS[item.action][0].format(target=item.target)
+        try:
+            ok = bool(self.client.send_request(endpoint, signed))
+        except Exception as e:
+            logging.warning(f"{item.action} {item.target} failed: {e}")
+            ok = False
+        with self._lock:
+            self.issued += 1
+            self.failed += not ok
+        return ok
+
+    def flush(self) -> List[Tuple[str, Any, bool]]:
+        """
+        Send everything queued, highest priority first, and wait for it
+
+        Returns (action, target, success) for every request sent
+        """
+        with self._lock:
+            batch = list(self._pending.values())
+            self._pending.clear()
+        ordered = sorted(batch)
+        signatures = self.client.generate_signatures([self._payload(item) for item in ordered])
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(self._send, item, signed) for item, signed in zip(ordered, signatures)]
+            return [
+                (item.action, item.target, future.result())
+                for item, future in zip(ordered, futures)
+            ]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Requests issued against requests saved by merging and cancelling
+        """
+        return {
+            'enqueued': self.enqueued,
+            'merged': self.merged,
+            'cancelled': self.cancelled,
+            'pending': len(self._pending),
+            'issued': self.issued,
+            'failed': self.failed,
+            'saved': self.merged + self.cancelled,
+        }
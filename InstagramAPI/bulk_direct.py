@@ -0,0 +1,165 @@
+"""
+Concurrent bulk direct messaging with delivery checkpoints
+
+Jobs are streamed, paced by a direct message rate limiter and sent by a pool
+of threads. Every delivered job id is appended to a checkpoint file, and jobs
+already in it are skipped, so a restarted campaign does not send twice.
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence
+
+from .rate_limit import RateLimiter
+
+__all__ = ["DirectJob", "BulkDirectSender"]
+
+# Direct messages per second when no limiter is given
+DEFAULT_DIRECT_RATE = 0.2
+
+TEXT_ENDPOINT = 'direct_v2/threads/broadcast/text/'
+MEDIA_SHARE_ENDPOINT = 'direct_v2/threads/broadcast/media_share/?media_type=photo'
+
+
+class DirectJob(NamedTuple):
+    """
+    One direct message
+
+    recipients: User pks of the (group) thread
+    text: Message text, or caption of the shared media
+    media_id: Media to share instead of sending plain text
+    key: Id recorded in the checkpoint, defaults to the recipients and a
+         hash of the text and media id
+    """
+    recipients: Sequence
+    text: str = ''
+    media_id: Optional[str] = None
+    key: Optional[str] = None
+
+    @property
+    def job_id(self) -> str:
+        if self.key is not None:
+            return self.key
+        content = hashlib.sha1(f'{self.media_id or ""}\n{self.text}'.encode()).hexdigest()[:16]
+        return ','.join(str(r) for r in self.recipients) + ':' + content
+
+
+class BulkDirectSender:
+    """
+    Send many direct messages concurrently, at most once each
+
+    A job is recorded as delivered right after its request succeeds. Its
+    `client_context` is derived from the job id, so if the process dies in
+    between, the resent message carries the same context as the first one.
+
+    Args:
+        client: InstagramAPI Logged-in client
+        checkpoint_path: str File the delivered job ids are appended to
+        limiter: RateLimiter Direct message rate bucket, DEFAULT_DIRECT_RATE
+                 per second when None
+        workers: int Messages in flight at once
+
+    Example:
+        sender = BulkDirectSender(api, 'campaign.delivered')
+        sender.send(
+            DirectJob([user_id], f'Hi {name}!') for user_id, name in audience
+        )
+        print(sender.stats())
+    """
+
+    def __init__(
+            self,
+            client,
+            checkpoint_path: str,
+            limiter: Optional[RateLimiter] = None,
+            workers: int = 4
+        ) -> None:
+        self.client = client
+        self.limiter = limiter or RateLimiter(rate=DEFAULT_DIRECT_RATE)
+        self.workers = workers
+
+        self.delivered = set()
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding='utf-8') as f:
+                self.delivered.update(line.rstrip('\n') for line in f if line.strip())
+        self._checkpoint = open(checkpoint_path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+        self.boundary = client.uuid
+        self.headers = client.multipart_headers(self.boundary)
+
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def build_body(self, job: DirectJob) -> bytes:
+        fields = [
+            ('recipient_users', json.dumps([[str(r) for r in job.recipients]])),
+            ('client_context', str(uuid.uuid5(uuid.NAMESPACE_OID, job.job_id))),
+            ('thread', '["0"]'),
+            ('text', job.text or ''),
+        ]
+        if job.media_id is not None:
+            fields.insert(0, ('media_id', job.media_id))
+        bodies = [{'type': 'form-data', 'name': name, 'data': data} for name, data in fields]
+        return self.client.build_body(bodies, self.boundary).encode()
+
+    def send_one(self, job: DirectJob) -> bool:
+        """
+        Send `job` unless it was delivered before
+        """
+        job_id = job.job_id
+        if job_id in self.delivered:
+            with self._lock:
+                self.skipped += 1
+            return True
+
+        self.limiter.acquire()
+        endpoint = MEDIA_SHARE_ENDPOINT if job.media_id is not None else TEXT_ENDPOINT
+        try:
+            ok = self.client.send_request(endpoint, self.build_body(job), headers=self.headers)
+        except Exception as e:
+            logging.warning(f"Direct message {job_id} failed: {e}")
+            ok = False
+
+        with self._lock:
+            if ok:
+                self.delivered.add(job_id)
+                self._checkpoint.write(job_id + '\n')
+                self._checkpoint.flush()
+                self.sent += 1
+            else:
+                self.failed += 1
+        return ok
+
+    def send(self, jobs: Iterable[DirectJob]) -> Dict[str, int]:
+        """
+        Send every job, reading `jobs` lazily
+
+        At most twice `workers` jobs are pulled from `jobs` ahead of the ones
+        being sent, so generators over huge audiences are fine.
+
+        Returns stats()
+        """
+        window = threading.BoundedSemaphore(self.workers * 2)
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for job in jobs:
+                window.acquire()
+                future = pool.submit(self.send_one, job)
+                future.add_done_callback(lambda _: window.release())
+        return self.stats()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'delivered': len(self.delivered),
+        }
+
+    def close(self) -> None:
+        self._checkpoint.close()
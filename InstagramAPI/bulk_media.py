@@ -0,0 +1,201 @@
+"""
+Bulk deletion and caption editing of media
+
+Targets are streamed (typically straight from the paginated user feed), sent
+with bounded concurrency and every completed media id is appended to a
+checkpoint file, so an interrupted cleanup resumes instead of starting over.
+"""
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+from .rate_limit import RateLimiter
+
+__all__ = ["BulkMediaJob", "MediaResult", "delete_media_many", "edit_media_many"]
+
+Target = Union[str, int, Dict[str, Any]]
+
+
+class MediaResult(NamedTuple):
+    media_id: str
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+class BulkMediaJob:
+    """
+    Apply one operation to many media, at most once each
+
+    Args:
+        operation: Callable[[dict], bool] Called with the feed item of every
+                   target (or {'id': target} for bare ids), True on success
+        checkpoint_path: str File completed media ids are appended to, no
+                         checkpointing when None
+        workers: int Requests in flight at once
+        limiter: RateLimiter Paces every request when given
+        on_result: Callable[[MediaResult], Any] Called after every target
+
+    `run` can be called several times; `close` the job when done.
+    """
+
+    def __init__(
+            self,
+            operation: Callable[[Dict[str, Any]], bool],
+            checkpoint_path: Optional[str] = None,
+            workers: int = 4,
+            limiter: Optional[RateLimiter] = None,
+            on_result: Optional[Callable[[MediaResult], Any]] = None
+        ) -> None:
+        self.operation = operation
+        self.workers = workers
+        self.limiter = limiter
+        self.on_result = on_result
+        self._lock = threading.Lock()
+
+        self.completed = set()
+        self._checkpoint = None
+        if checkpoint_path is not None:
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path, encoding='utf-8') as f:
+                    self.completed.update(line.rstrip('\n') for line in f if line.strip())
+            self._checkpoint = open(checkpoint_path, 'a', encoding='utf-8')
+
+        self.done = 0
+        self.skipped = 0
+        self.failures: List[MediaResult] = []
+        self.busy_seconds = 0.0
+        self.elapsed = 0.0
+
+    def _apply(self, item: Dict[str, Any]) -> MediaResult:
+        media_id = str(item['id'])
+        if self.limiter is not None:
+            self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            ok = bool(self.operation(item))
+            error = None if ok else 'request failed'
+        except Exception as e:
+            ok, error = False, str(e)
+        result = MediaResult(media_id, ok, time.monotonic() - started, error)
+
+        with self._lock:
+            self.busy_seconds += result.seconds
+            if ok:
+                self.done += 1
+                self.completed.add(media_id)
+                if self._checkpoint is not None:
+                    self._checkpoint.write(media_id + '\n')
+                    self._checkpoint.flush()
+            else:
+                self.failures.append(result)
+                logging.warning(f"Bulk operation on {media_id} failed: {error}")
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    def run(self, targets: Iterable[Target]) -> Dict[str, float]:
+        """
+        Apply the operation to every target not completed before
+
+        `targets` is read lazily, at most twice `workers` ahead of the
+        requests in flight.
+
+        Returns stats()
+        """
+        started = time.monotonic()
+        window = threading.BoundedSemaphore(self.workers * 2)
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for target in targets:
+                item = target if isinstance(target, dict) else {'id': target}
+                if str(item['id']) in self.completed:
+                    self.skipped += 1
+                    continue
+                window.acquire()
+                future = pool.submit(self._apply, item)
+                future.add_done_callback(lambda _: window.release())
+        self.elapsed += time.monotonic() - started
+        return self.stats()
+
+    def stats(self) -> Dict[str, float]:
+        attempted = self.done + len(self.failures)
+        return {
+            'done': self.done,
+            'failed': len(self.failures),
+            'skipped': self.skipped,
+            'elapsed': self.elapsed,
+            'per_second': self.done / self.elapsed if self.elapsed else 0.0,
+            'mean_latency': self.busy_seconds / attempted if attempted else 0.0,
+        }
+
+    def close(self) -> None:
+        """
+        Close the checkpoint file, run() must not be called afterwards
+        """
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            self._checkpoint = None
+
+
+def delete_media_many(client, targets: Optional[Iterable[Target]] = None, **kwargs) -> BulkMediaJob:
+    """
+    Delete many media
+
+    Args:
+        client: InstagramAPI Logged-in client
+        targets: Feed items or media ids, the whole own feed when None
+        **kwargs: Passed on to BulkMediaJob (checkpoint_path, workers...)
+
+    Returns the finished job, see its stats() and failures
+
+    Example:
+        job = delete_media_many(api, checkpoint_path='deleted.txt')
+        print(job.stats(), job.failures)
+    """
+    if targets is None:
+        targets = client.iter_self_user_feed()
+
+    def delete(item: Dict[str, Any]) -> bool:
+        return client.delete_media(item['id'], item.get('media_type', 1))
+
+    job = BulkMediaJob(delete, **kwargs)
+    try:
+        job.run(targets)
+    finally:
+        job.close()
+    return job
+
+
+def edit_media_many(
+        client,
+        caption: Union[str, Callable[[Dict[str, Any]], str]],
+        targets: Optional[Iterable[Target]] = None,
+        **kwargs
+    ) -> BulkMediaJob:
+    """
+    Set the caption of many media
+
+    Args:
+        client: InstagramAPI Logged-in client
+        caption: New caption, or a callable building it from the feed item
+        targets: Feed items or media ids, the whole own feed when None
+        **kwargs: Passed on to BulkMediaJob (checkpoint_path, workers...)
+
+    Returns the finished job, see its stats() and failures
+    """
+    if targets is None:
+        targets = client.iter_self_user_feed()
+
+    def edit(item: Dict[str, Any]) -> bool:
+        text = caption(item) if callable(caption) else caption
+        return client.edit_media(item['id'], text)
+
+    job = BulkMediaJob(edit, **kwargs)
+    try:
+        job.run(targets)
+    finally:
+        job.close()
+    return job
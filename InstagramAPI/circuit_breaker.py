@@ -0,0 +1,135 @@
+"""
+Per-account circuit breaker
+
+Once an account keeps failing (connection errors, 5xx) or hits an account
+level error (checkpoint, logged out, rate limited, sentry block), further
+requests are doomed to fail the same way. The breaker then opens and
+requests fail fast with CircuitOpenException instead of being sent. After
+`reset_timeout` one probe request is let through (half-open): its success
+closes the breaker, its failure opens it again.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from .exceptions import ACCOUNT_ERRORS, CircuitOpenException, RateLimitException
+
+__all__ = ["CircuitBreaker", "CLOSED", "OPEN", "HALF_OPEN"]
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an account is failing, and probe until it recovers
+
+    Args:
+        failure_threshold: int Consecutive transient failures that open the breaker
+        reset_timeout: float Seconds the breaker stays open before a probe
+        max_reset_timeout: float Upper bound of the open time, which doubles
+                           every time a probe fails
+
+    Example:
+        api.set_circuit_breaker(CircuitBreaker(failure_threshold=5, reset_timeout=30))
+        try:
+            api.get_username_info(user_id)
+        except CircuitOpenException as e:
+            requeue(user_id, not_before=e.retry_at)
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_reset_timeout: float = 600.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error: Optional[BaseException] = None
+        self._timeout = reset_timeout
+        self._retry_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        raise CircuitOpenException(
+            f'Circuit breaker open after {self.last_error!r}, retry in {max(self._retry_at - time.monotonic(), 0):.0f} s',
+            self._retry_at
+        )
+
+    def check(self) -> None:
+        """
+        Raise CircuitOpenException if a request would be rejected right now
+
+        Does not reserve the half-open probe, so it can be called before
+        queueing a request.
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() < self._retry_at:
+                self._reject()
+            if self.state == HALF_OPEN and self._probing:
+                self._reject()
+
+    def before_request(self) -> None:
+        """
+        Call right before sending; raises CircuitOpenException if the request
+        must not be sent. Every call that returns must be followed by
+        `record_success` or `record_failure`.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                if time.monotonic() < self._retry_at:
+                    self._reject()
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                self._reject()
+            self._probing = True
+
+    def record_success(self) -> None:
+        """
+        The account answered (any response that is not an account or
+        transient error)
+        """
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+            self._timeout = self.reset_timeout
+
+    def record_failure(self, error: BaseException) -> None:
+        """
+        The request failed with `error`
+        """
+        with self._lock:
+            self.last_error = error
+            self.failures += 1
+            probe_failed = self.state == HALF_OPEN
+            self._probing = False
+            if not probe_failed and not isinstance(error, ACCOUNT_ERRORS) and self.failures < self.failure_threshold:
+                return
+            if probe_failed:
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            timeout = self._timeout
+            if isinstance(error, RateLimitException) and error.retry_after:
+                timeout = max(timeout, error.retry_after)
+            self.state = OPEN
+            self._retry_at = time.monotonic() + timeout
+            self.opened += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+            'retry_in': max(self._retry_at - time.monotonic(), 0.0) if self.state == OPEN else 0.0,
+            'last_error': repr(self.last_error) if self.last_error is not None else None,
+        }
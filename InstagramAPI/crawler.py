@@ -0,0 +1,228 @@
+"""
+Fan-out crawling of followers/followings for many target accounts
+
+Targets are deduplicated and spread across a pool of logged-in clients, each
+driven by one or more worker threads. Pages are written to a streaming sink
+as they arrive instead of being collected in memory.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+__all__ = ["FollowerCrawler", "JSONLinesSink", "CrawlShard", "iter_relation_pages"]
+
+PAGE_METHODS = {
+    'followers': 'get_user_followers',
+    'followings': 'get_user_followings',
+}
+
+# Tells a worker thread that no targets are left
+_DONE = object()
+
+
+def iter_relation_pages(
+        client,
+        target_id,
+        relation: str = 'followers',
+        max_pages: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the users of every followers/followings page of `target_id`
+
+    Args:
+        client: InstagramAPI Logged-in client
+        target_id: User id to crawl
+        relation: str 'followers' or 'followings'
+        max_pages: int Stop after this many pages (None for all)
+
+    Raises RuntimeError when a page request fails with an error of no known
+    kind, and the RequestFailedException subclass of the others.
+    """
+    fetch = getattr(client, PAGE_METHODS[relation])
+    next_max_id = None
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        ok = fetch(target_id, next_max_id)
+        page = client.last_json
+        if not ok:
+            raise RuntimeError(f'{relation} page request for {target_id} failed')
+        pages += 1
+        yield page.get('users', [])
+
+        next_max_id = page.get('next_max_id')
+        if not page.get('big_list') or not next_max_id:
+            return
+
+
+class JSONLinesSink:
+    """
+    Thread safe sink writing one JSON line per crawled user
+
+    Each line looks like {"target": <target id>, "user": {...}}
+
+    Args:
+        path: str File to append to
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, target_id, users: List[Dict[str, Any]]) -> None:
+        lines = ''.join(
+            json.dumps({'target': target_id, 'user': user}) + '\n'
+            for user in users
+        )
+        with self._lock:
+            self._file.write(lines)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class CrawlShard:
+    """
+    One logged-in client and its throughput counters
+
+    The worker threads of a shard send requests on the client concurrently;
+    `last_json` is kept per thread.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.targets = 0
+        self.pages = 0
+        self.records = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+        self._counter_lock = threading.Lock()
+
+    def add(self, targets=0, pages=0, records=0, errors=0) -> None:
+        with self._counter_lock:
+            self.targets += targets
+            self.pages += pages
+            self.records += records
+            self.errors += errors
+
+    @property
+    def name(self) -> str:
+        return str(getattr(self.client, 'username', id(self.client)))
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            'shard': self.name,
+            'targets': self.targets,
+            'pages': self.pages,
+            'records': self.records,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'records_per_sec': self.records / elapsed if elapsed else 0.0,
+            'pages_per_sec': self.pages / elapsed if elapsed else 0.0,
+        }
+
+
+class FollowerCrawler:
+    """
+    Crawl the followers (or followings) of a stream of target ids
+
+    Args:
+        clients: List[InstagramAPI] Logged-in clients to shard targets across
+        sink: Object with a `write(target_id, users)` method, e.g. JSONLinesSink
+        relation: str 'followers' or 'followings'
+        threads_per_client: int Worker threads driving each client
+        max_pages: int Stop after this many pages per target (None for all)
+        queue_size: int Targets buffered ahead of the workers
+
+    Pages of a single target are fetched one at a time, since each page needs
+    the cursor of the previous one, so a target never has more than one page
+    in flight.
+
+    Example:
+        crawler = FollowerCrawler([api1, api2], JSONLinesSink('followers.jsonl'))
+        crawler.run(user_ids)
+        print(crawler.stats())
+    """
+    def __init__(
+            self,
+            clients: List[Any],
+            sink,
+            relation: str = 'followers',
+            threads_per_client: int = 1,
+            max_pages: Optional[int] = None,
+            queue_size: int = 1000
+        ) -> None:
+        if not clients:
+            raise ValueError('FollowerCrawler needs at least one client')
+        if relation not in PAGE_METHODS:
+            raise ValueError(f'relation must be one of {list(PAGE_METHODS)}')
+
+        self.shards = [CrawlShard(client) for client in clients]
+        self.sink = sink
+        self.relation = relation
+        self.threads_per_client = threads_per_client
+        self.max_pages = max_pages
+        self.queue_size = queue_size
+        self.duplicates = 0
+
+    def run(self, targets: Iterable) -> List[Dict[str, Any]]:
+        """
+        Crawl every unique target and block until all are done
+
+        Returns the per shard statistics
+        """
+        work = queue.Queue(maxsize=self.queue_size)
+        workers = []
+        for shard in self.shards:
+            shard.started = time.time()
+            shard.finished = None
+            for _ in range(self.threads_per_client):
+                worker = threading.Thread(target=self._worker, args=(shard, work), daemon=True)
+                worker.start()
+                workers.append(worker)
+
+        seen = set()
+        for target_id in targets:
+            key = str(target_id)
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            work.put(target_id)
+        for _ in workers:
+            work.put(_DONE)
+
+        for worker in workers:
+            worker.join()
+        for shard in self.shards:
+            shard.finished = time.time()
+            logging.info(f"Crawl shard {shard.name}: {shard.stats()}")
+        return self.stats()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [shard.stats() for shard in self.shards]
+
+    def _worker(self, shard: CrawlShard, work: queue.Queue) -> None:
+        while True:
+            target_id = work.get()
+            if target_id is _DONE:
+                return
+            try:
+                self._crawl_target(shard, target_id)
+            except Exception as e:
+                shard.add(errors=1)
+                logging.warning(f"Crawl of {target_id} failed on {shard.name}: {e}")
+            shard.add(targets=1)
+
+    def _crawl_target(self, shard: CrawlShard, target_id) -> None:
+        pages = iter_relation_pages(shard.client, target_id, self.relation, self.max_pages)
+        for users in pages:
+            self.sink.write(target_id, users)
+            shard.add(pages=1, records=len(users))
@@ -0,0 +1,211 @@
+"""
+Concurrent media downloader with content-addressed storage
+
+Picks one candidate url per photo/video of a feed item, streams it to disk
+while hashing it and stores it under its sha256, so media reposted under
+another url is kept once. Urls already downloaded are skipped without any
+network I/O.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import urllib.parse
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+__all__ = ["MediaDownloader", "iter_media_urls", "select_candidate"]
+
+Policy = Union[str, int, Callable[[List[Dict[str, Any]]], Dict[str, Any]]]
+
+
+def select_candidate(candidates: List[Dict[str, Any]], policy: Policy = 'largest') -> Optional[Dict[str, Any]]:
+    """
+    Pick one of the `image_versions2` / `video_versions` candidates
+
+    Args:
+        candidates: List[dict] Candidates with url, width and height
+        policy: 'largest', 'smallest', an int to get the largest candidate at
+                most that wide (the smallest one if none is), or a callable
+                picking from the list itself
+    """
+    if not candidates:
+        return None
+    if callable(policy):
+        return policy(candidates)
+
+    def area(candidate):
+        return (candidate.get('width') or 0) * (candidate.get('height') or 0)
+
+    if policy == 'largest':
+        return max(candidates, key=area)
+    if policy == 'smallest':
+        return min(candidates, key=area)
+    if isinstance(policy, int):
+        fitting = [candidate for candidate in candidates if (candidate.get('width') or 0) <= policy]
+        return max(fitting, key=area) if fitting else min(candidates, key=area)
+    raise ValueError(f'Unknown candidate policy {policy!r}')
+
+
+def iter_media_urls(item: Dict[str, Any], policy: Policy = 'largest') -> Iterator[str]:
+    """
+    Yield the url to download for every photo/video of a feed item
+
+    Carousels yield one url per child, videos their video rather than the cover.
+    """
+    for media in item.get('carousel_media') or [item]:
+        candidates = media.get('video_versions') or (media.get('image_versions2') or {}).get('candidates')
+        candidate = select_candidate(candidates or [], policy)
+        if candidate is not None:
+            yield candidate['url']
+
+
+def url_key(url: str) -> str:
+    """
+    Url without its query string
+
+    CDN urls carry signatures in the query string that change over time,
+    while the path identifies the file.
+    """
+    parts = urllib.parse.urlsplit(url)
+    return f'{parts.netloc}{parts.path}'
+
+
+class MediaDownloader:
+    """
+    Download media of feed items into a content-addressed directory
+
+    Files end up in `directory/<sha256[:2]>/<sha256><extension>`. An sqlite
+    index in the same directory maps downloaded urls to their files.
+
+    Args:
+        directory: str Where media is stored
+        policy: Candidate selection policy, see `select_candidate`
+        workers: int Downloads in flight at once, also the connection pool size
+        chunk_size: int Bytes read per chunk while streaming
+        timeout: float Timeout of a single request
+
+    Example:
+        downloader = MediaDownloader('media')
+        api.get_user_feed(user_id)
+        paths = downloader.download(api.last_json['items'])
+        print(downloader.stats())
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            policy: Policy = 'largest',
+            workers: int = 8,
+            chunk_size: int = 64 * 1024,
+            timeout: float = 30.0
+        ) -> None:
+        self.directory = directory
+        self.policy = policy
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        os.makedirs(directory, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.db = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS downloads '
+            '(url TEXT PRIMARY KEY, sha256 TEXT, path TEXT, size INTEGER)'
+        )
+        self.db.commit()
+        self._lock = threading.Lock()
+
+        self.downloaded = 0
+        self.skipped = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def stored_path(self, url: str) -> Optional[str]:
+        """
+        File `url` was stored in, None if it was never downloaded
+        """
+        with self._lock:
+            row = self.db.execute('SELECT path FROM downloads WHERE url = ?', (url_key(url),)).fetchone()
+        return row[0] if row is not None else None
+
+    def download_url(self, url: str) -> Optional[str]:
+        """
+        Download `url` unless already stored, returns the path of its file
+        """
+        path = self.stored_path(url)
+        if path is not None and os.path.exists(path):
+            with self._lock:
+                self.skipped += 1
+            return path
+
+        extension = os.path.splitext(urllib.parse.urlsplit(url).path)[1]
+        digest = hashlib.sha256()
+        size = 0
+        handle, partial = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(self.chunk_size):
+                        output.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+        except Exception as e:
+            os.remove(partial)
+            logging.warning(f"Download of {url} failed: {e}")
+            with self._lock:
+                self.failed += 1
+            return None
+
+        sha256 = digest.hexdigest()
+        folder = os.path.join(self.directory, sha256[:2])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, sha256 + extension)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(partial)
+                self.deduplicated += 1
+            else:
+                os.replace(partial, path)
+            self.db.execute(
+                'INSERT OR REPLACE INTO downloads (url, sha256, path, size) VALUES (?, ?, ?, ?)',
+                (url_key(url), sha256, path, size)
+            )
+            self.db.commit()
+            self.downloaded += 1
+            self.bytes += size
+        return path
+
+    def download(self, items: Iterable[Dict[str, Any]]) -> List[Tuple[str, Optional[str]]]:
+        """
+        Download every photo/video of the feed items concurrently
+
+        Returns (url, path) per media, path is None when the download failed
+        """
+        urls = list(dict.fromkeys(url for item in items for url in iter_media_urls(item, self.policy)))
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return list(zip(urls, pool.map(self.download_url, urls)))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'downloaded': self.downloaded,
+            'skipped': self.skipped,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'bytes': self.bytes,
+        }
+
+    def close(self) -> None:
+        self.session.close()
+        self.db.close()
@@ -0,0 +1,236 @@
+"""
+Engagement statistics over a user's feed
+
+Likers and comments of every feed item are fetched concurrently while the feed
+is still being paged, and each post is handed out as soon as it is complete.
+`EngagementReport` folds them into counters kept in numpy arrays (or plain
+`array` when numpy is not installed): per-post engagement, top engagers by pk
+and engagement rates per time bucket.
+"""
+import array
+import concurrent.futures
+import heapq
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .exceptions import RequestFailedException
+from .rate_limit import RateLimiter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["EngagementReport", "PostEngagement", "iter_post_engagement"]
+
+
+class PostEngagement(NamedTuple):
+    media_id: str
+    taken_at: int
+    like_count: int
+    comment_count: int
+    likers: List[Any]  # pks
+    commenters: List[Any]  # pks, once per comment
+
+
+class PkCounter:
+    """
+    Counts per user pk, stored in a growable int64 array
+    """
+
+    def __init__(self) -> None:
+        self.slots: Dict[Any, int] = {}
+        self.pks: List[Any] = []
+        self.counts = np.zeros(1024, dtype=np.int64) if np is not None else array.array('q')
+
+    def add(self, pks: Iterable[Any]) -> None:
+        slots = []
+        for pk in pks:
+            slot = self.slots.get(pk)
+            if slot is None:
+                slot = self.slots[pk] = len(self.pks)
+                self.pks.append(pk)
+            slots.append(slot)
+        if np is None:
+            self.counts.extend([0] * (len(self.pks) - len(self.counts)))
+            for slot in slots:
+                self.counts[slot] += 1
+            return
+        if len(self.pks) > len(self.counts):
+            grown = np.zeros(max(len(self.pks), 2 * len(self.counts)), dtype=np.int64)
+            grown[:len(self.counts)] = self.counts
+            self.counts = grown
+        np.add.at(self.counts, np.asarray(slots, dtype=np.int64), 1)
+
+    def __getitem__(self, pk) -> int:
+        slot = self.slots.get(pk)
+        return int(self.counts[slot]) if slot is not None else 0
+
+    def top(self, n: int) -> List[Tuple[Any, int]]:
+        size = len(self.pks)
+        if np is None:
+            best = heapq.nlargest(n, range(size), key=self.counts.__getitem__)
+        else:
+            counts = self.counts[:size]
+            best = np.argpartition(-counts, n - 1)[:n] if n < size else np.arange(size)
+            best = sorted(best, key=lambda slot: -counts[slot])
+        return [(self.pks[slot], int(self.counts[slot])) for slot in best]
+
+
+def _fetch_post(client, item: Dict[str, Any], max_comment_pages: Optional[int], limiter: Optional[RateLimiter]) -> PostEngagement:
+    media_id = str(item['id'])
+    if limiter is not None:
+        limiter.acquire()
+    likers = []
+    try:
+        if client.get_media_likers(media_id):
+            likers = [user['pk'] for user in client.last_json.get('users', [])]
+    except RequestFailedException as e:
+        logging.warning(f"Likers of {media_id} failed: {e!r}")
+
+    commenters = []
+    max_id = ''
+    pages = 0
+    while max_comment_pages is None or pages < max_comment_pages:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            if not client.get_media_comments(media_id, max_id):
+                break
+        except RequestFailedException as e:
+            logging.warning(f"Comments of {media_id} failed: {e!r}")
+            break
+        page = client.last_json
+        pages += 1
+        commenters.extend(
+            comment.get('user_id') or (comment.get('user') or {}).get('pk')
+            for comment in page.get('comments', [])
+        )
+        max_id = page.get('next_max_id')
+        if not page.get('has_more_comments') or not max_id:
+            break
+
+    return PostEngagement(
+        media_id,
+        item.get('taken_at') or 0,
+        item.get('like_count', len(likers)),
+        item.get('comment_count', len(commenters)),
+        likers,
+        [pk for pk in commenters if pk is not None]
+    )
+
+
+def iter_post_engagement(
+        client,
+        items: Iterable[Dict[str, Any]],
+        workers: int = 8,
+        max_comment_pages: Optional[int] = None,
+        limiter: Optional[RateLimiter] = None
+    ) -> Iterator[PostEngagement]:
+    """
+    Fetch likers and comments of every feed item concurrently
+
+    Items are read lazily (e.g. `client.iter_user_feed(user_id)`) and posts
+    are yielded in completion order as soon as they are done.
+
+    Args:
+        client: InstagramAPI Logged-in client
+        items: Iterable[dict] Feed items
+        workers: int Posts fetched at once
+        max_comment_pages: int Comment pages read per post (None for all)
+        limiter: RateLimiter Paces every request when given
+    """
+    pending = set()
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for item in items:
+            pending.add(pool.submit(_fetch_post, client, item, max_comment_pages, limiter))
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+class EngagementReport:
+    """
+    Aggregated engagement of a set of posts
+
+    Args:
+        bucket_seconds: int Width of the time buckets, by post `taken_at`
+
+    Example:
+        report = EngagementReport()
+        for post in iter_post_engagement(api, api.iter_user_feed(user_id)):
+            report.add(post)
+        print(report.top_engagers(10), report.time_buckets())
+    """
+
+    def __init__(self, bucket_seconds: int = 7 * 24 * 3600) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.likes = PkCounter()
+        self.comments = PkCounter()
+        self.media_ids: List[str] = []
+        self._posts = array.array('q')  # taken_at, like_count, comment_count per post
+        self._lock = threading.Lock()
+
+    def add(self, post: PostEngagement) -> None:
+        with self._lock:
+            self.media_ids.append(post.media_id)
+            self._posts.extend((post.taken_at, post.like_count, post.comment_count))
+            self.likes.add(post.likers)
+            self.comments.add(post.commenters)
+
+    def __len__(self) -> int:
+        return len(self.media_ids)
+
+    def per_post(self) -> Dict[str, Tuple[int, int]]:
+        """
+        {media_id: (like_count, comment_count)}
+        """
+        posts = self._posts
+        return {
+            media_id: (posts[3 * i + 1], posts[3 * i + 2])
+            for i, media_id in enumerate(self.media_ids)
+        }
+
+    def top_engagers(self, n: int = 10) -> List[Tuple[Any, int, int]]:
+        """
+        (pk, likes, comments) of the `n` users engaging the most, likes and
+        comments counting the same
+        """
+        if not self.comments.pks:
+            return [(pk, likes, 0) for pk, likes in self.likes.top(n)]
+        engagers = self.likes.slots.keys() | self.comments.slots.keys()
+        best = heapq.nlargest(n, engagers, key=lambda pk: self.likes[pk] + self.comments[pk])
+        return [(pk, self.likes[pk], self.comments[pk]) for pk in best]
+
+    def time_buckets(self) -> Dict[int, Dict[str, float]]:
+        """
+        {bucket start timestamp: posts, likes and comments per post}
+        """
+        if np is not None and self._posts:
+            posts = np.frombuffer(self._posts, dtype=np.int64).reshape(-1, 3)
+            starts = posts[:, 0] // self.bucket_seconds * self.bucket_seconds
+            keys, index, counts = np.unique(starts, return_inverse=True, return_counts=True)
+            likes = np.bincount(index, weights=posts[:, 1])
+            comments = np.bincount(index, weights=posts[:, 2])
+            rows = zip(keys.tolist(), counts.tolist(), likes.tolist(), comments.tolist())
+        else:
+            totals: Dict[int, List[int]] = {}
+            for i in range(0, len(self._posts), 3):
+                taken_at, like_count, comment_count = self._posts[i:i + 3]
+                bucket = totals.setdefault(taken_at // self.bucket_seconds * self.bucket_seconds, [0, 0, 0])
+                bucket[0] += 1
+                bucket[1] += like_count
+                bucket[2] += comment_count
+            rows = ((start, *values) for start, values in sorted(totals.items()))
+        return {
+            int(start): {
+                'posts': int(count),
+                'likes_per_post': like_total / count,
+                'comments_per_post': comment_total / count,
+            }
+            for start, count, like_total, comment_total in rows
+        }
@@ -1,6 +1,7 @@
 """
 Instagram API exceptions
 """
+from typing import Any, Optional
 
 class InstagramAPIException(Exception):
     """
@@ -34,5 +35,96 @@ class UnsupportedMediaType(InstagramAPIException):
             .mov
     """
 
-class SentryBlockException(InstagramAPIException):
-    pass
+class RequestFailedException(InstagramAPIException):
+    """
+    Request was answered with an error
+
+    Args:
+        message: str
+        status_code: int HTTP status, None when no response was received
+        response: Decoded error body, if any
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, response: Any = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+class SentryBlockException(RequestFailedException):
+    """
+    Account or device was blocked by Instagram's spam protection
+    """
+
+class CheckpointRequiredException(RequestFailedException):
+    """
+    Account has to pass a challenge (`response['checkpoint_url']`) in the app
+    """
+
+class LoginRequiredException(RequestFailedException):
+    """
+    Session was logged out by Instagram, log in again
+    """
+
+class RateLimitException(RequestFailedException):
+    """
+    Too many requests (429) or the action is blocked for now (feedback_required)
+
+    `retry_after` is the number of seconds the server asked to wait, if any
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, response: Any = None, retry_after: Optional[float] = None) -> None:
+        super().__init__(message, status_code, response)
+        self.retry_after = retry_after
+
+class NotFoundException(RequestFailedException):
+    """
+    Requested user, media or thread does not exist or is not visible
+    """
+
+class TransientException(RequestFailedException):
+    """
+    Server error (5xx) or connection failure, the same request may succeed later
+    """
+
+class CircuitOpenException(RequestFailedException):
+    """
+    Request was not sent because the account's circuit breaker is open
+
+    `retry_at` is the `time.monotonic()` at which a probe request is allowed
+    """
+
+    def __init__(self, message: str, retry_at: float) -> None:
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+# Account level errors: every further request of the account fails the same way
+ACCOUNT_ERRORS = (CheckpointRequiredException, LoginRequiredException, RateLimitException, SentryBlockException)
+
+
+def classify_error(status_code: int, response: Any = None, retry_after: Optional[float] = None) -> Optional[RequestFailedException]:
+    """
+    Exception for an error response, None when it is not one of the known kinds
+
+    Args:
+        status_code: int HTTP status
+        response: Decoded error body ({'message': ..., 'error_type': ...})
+        retry_after: float Retry-After header in seconds
+    """
+    body = response if isinstance(response, dict) else {}
+    message = str(body.get('message') or f'Request returned {status_code}')
+    error_type = body.get('error_type')
+
+    if error_type == 'sentry_block':
+        return SentryBlockException(message, status_code, response)
+    if message == 'checkpoint_required' or error_type in ('checkpoint_challenge_required', 'checkpoint_logged_out'):
+        return CheckpointRequiredException(message, status_code, response)
+    if message == 'login_required':
+        return LoginRequiredException(message, status_code, response)
+    if status_code == 429 or message == 'feedback_required' or body.get('spam'):
+        return RateLimitException(message, status_code, response, retry_after)
+    if status_code == 404 or error_type in ('user_not_found', 'media_not_found'):
+        return NotFoundException(message, status_code, response)
+    if status_code >= 500:
+        return TransientException(message, status_code, response)
+    return None
@@ -0,0 +1,32 @@
+"""
+Compact friendship status, as returned by the friendship endpoints
+"""
+from typing import Any, Dict, NamedTuple
+
+__all__ = ["Friendship", "SHOW_MANY_LIMIT", "parse_friendship_statuses"]
+
+# Most user ids the friendships/show_many/ endpoint answers per request
+SHOW_MANY_LIMIT = 100
+
+
+class Friendship(NamedTuple):
+    following: bool = False
+    followed_by: bool = False
+    blocking: bool = False
+    is_private: bool = False
+    incoming_request: bool = False
+    outgoing_request: bool = False
+
+    @classmethod
+    def from_json(cls, status: Dict[str, Any]) -> 'Friendship':
+        return cls(*(bool(status.get(field)) for field in cls._fields))
+
+
+def parse_friendship_statuses(data: Dict[str, Any]) -> Dict[str, Friendship]:
+    """
+    {user_id: Friendship} from a friendships/show_many/ response
+    """
+    return {
+        user_id: Friendship.from_json(status)
+        for user_id, status in data.get('friendship_statuses', {}).items()
+    }
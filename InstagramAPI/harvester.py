@@ -0,0 +1,245 @@
+"""
+Continuous, deduplicating harvester for hashtag and location feeds
+
+Media already seen are dropped by pk using a bounded-memory bloom filter in
+front of an exact sqlite index on disk, so only new items are emitted no matter
+how often the same media shows up across pages and poll cycles.
+"""
+import hashlib
+import heapq
+import logging
+import math
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+__all__ = ["BloomFilter", "SeenIndex", "FeedHarvester"]
+
+
+class BloomFilter:
+    """
+    Fixed size bloom filter over str/int keys
+
+    Args:
+        capacity: int Number of keys the filter is sized for
+        error_rate: float False positive rate at `capacity` keys
+
+    Past `capacity` the false positive rate grows but memory does not.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key) -> Iterator[int]:
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class SeenIndex:
+    """
+    Exact set of seen media pks, stored in sqlite and fronted by a bloom filter
+
+    Most new media are rejected by the in-memory filter without touching disk;
+    only filter hits are confirmed against the index.
+
+    Args:
+        path: str sqlite database file (':memory:' for a throwaway index)
+        capacity: int Keys the bloom filter is sized for
+        error_rate: float Bloom filter false positive rate
+    """
+
+    def __init__(self, path: str, capacity: int = 1_000_000, error_rate: float = 0.001) -> None:
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen (pk TEXT PRIMARY KEY)')
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.lookups = 0
+        self.disk_lookups = 0
+        for (pk,) in self.db.execute('SELECT pk FROM seen'):
+            self.bloom.add(pk)
+
+    def add(self, pk) -> bool:
+        """
+        Record `pk`, returns True if it had not been seen before
+        """
+        pk = str(pk)
+        self.lookups += 1
+        if pk in self.bloom:
+            self.disk_lookups += 1
+            if self.db.execute('SELECT 1 FROM seen WHERE pk = ?', (pk,)).fetchone():
+                return False
+        self.db.execute('INSERT OR IGNORE INTO seen (pk) VALUES (?)', (pk,))
+        self.bloom.add(pk)
+        return True
+
+    def __contains__(self, pk) -> bool:
+        pk = str(pk)
+        if pk not in self.bloom:
+            return False
+        return self.db.execute('SELECT 1 FROM seen WHERE pk = ?', (pk,)).fetchone() is not None
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+class _Source:
+    def __init__(self, kind: str, key) -> None:
+        self.kind = kind
+        self.key = key
+        self.rate = 0.0
+        self.last_poll = None
+        self.polls = 0
+        self.new_items = 0
+
+    def __lt__(self, other: '_Source') -> bool:
+        return self.rate > other.rate
+
+
+class FeedHarvester:
+    """
+    Poll many hashtag and location feeds and emit only media not seen before
+
+    Each poll walks a feed from the top by `next_max_id` until a page brings
+    nothing new (or `max_pages` is reached). Feeds are scheduled by how fast
+    they produce new media: the interval until the next poll is chosen so a
+    poll is expected to bring about `target_new` items, clamped between
+    `min_interval` and `max_interval` seconds.
+
+    Args:
+        client: InstagramAPI Logged-in client
+        index: SeenIndex Shared index of seen media pks
+        max_pages: int Page limit for a single poll
+        target_new: float New items a poll should ideally find
+        min_interval: float Seconds between polls of the busiest feed
+        max_interval: float Seconds between polls of an idle feed
+        smoothing: float Weight of the latest poll in the rate average
+
+    Example:
+        harvester = FeedHarvester(api, SeenIndex('seen.db'))
+        harvester.add_hashtags(['python', 'coding'])
+        for source, media in harvester.harvest():
+            ...
+    """
+
+    def __init__(
+            self,
+            client,
+            index: SeenIndex,
+            max_pages: int = 5,
+            target_new: float = 20.0,
+            min_interval: float = 30.0,
+            max_interval: float = 3600.0,
+            smoothing: float = 0.3
+        ) -> None:
+        self.client = client
+        self.index = index
+        self.max_pages = max_pages
+        self.target_new = target_new
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.sources: Dict[Tuple[str, Any], _Source] = {}
+        self._schedule = []
+        self.requests = 0
+
+    def add_hashtags(self, hashtags: Iterable[str]) -> None:
+        for hashtag in hashtags:
+            self._add('hashtag', hashtag)
+
+    def add_locations(self, location_ids: Iterable) -> None:
+        for location_id in location_ids:
+            self._add('location', location_id)
+
+    def _add(self, kind: str, key) -> None:
+        if (kind, key) in self.sources:
+            return
+        source = self.sources[kind, key] = _Source(kind, key)
+        heapq.heappush(self._schedule, (time.time(), source))
+
+    def _fetch(self, source: _Source, max_id) -> Optional[Dict[str, Any]]:
+        self.requests += 1
+        if source.kind == 'hashtag':
+            ok = self.client.get_hashtag_feed(source.key, max_id)
+        else:
+            ok = self.client.get_location_feed(source.key, max_id or '')
+        return self.client.last_json if ok else None
+
+    def poll(self, source: _Source) -> Iterator[Dict[str, Any]]:
+        """
+        Poll one feed and yield its media that were not seen before
+        """
+        max_id = None
+        found = 0
+        for _ in range(self.max_pages):
+            page = self._fetch(source, max_id)
+            if page is None:
+                break
+            new_on_page = 0
+            for item in page.get('ranked_items', []) + page.get('items', []):
+                if self.index.add(item['pk']):
+                    new_on_page += 1
+                    yield item
+            found += new_on_page
+            max_id = page.get('next_max_id')
+            if not new_on_page or not max_id or not page.get('more_available', True):
+                break
+        self.index.commit()
+
+        now = time.time()
+        if source.last_poll is not None:
+            rate = found / max(now - source.last_poll, 1e-6)
+            source.rate += self.smoothing * (rate - source.rate)
+        source.last_poll = now
+        source.polls += 1
+        source.new_items += found
+
+    def next_interval(self, source: _Source) -> float:
+        if source.rate <= 0:
+            return self.max_interval if source.polls > 1 else self.min_interval
+        return min(self.max_interval, max(self.min_interval, self.target_new / source.rate))
+
+    def harvest(self, stop=None) -> Iterator[Tuple[Tuple[str, Any], Dict[str, Any]]]:
+        """
+        Poll feeds as they come due and yield ((kind, key), media) for new media
+
+        Args:
+            stop: Optional threading.Event ending the harvest once set
+        """
+        while self._schedule and not (stop is not None and stop.is_set()):
+            due, source = self._schedule[0]
+            delay = due - time.time()
+            if delay > 0:
+                if stop is not None:
+                    stop.wait(delay)
+                    continue
+                time.sleep(delay)
+            heapq.heappop(self._schedule)
+            interval = None
+            try:
+                for item in self.poll(source):
+                    yield (source.kind, source.key), item
+            except Exception as e:
+                logging.warning(f"Polling {source.kind} {source.key} failed: {e}")
+                # Back off from a failing feed instead of retrying it hot
+                interval = self.max_interval
+            if interval is None:
+                interval = self.next_interval(source)
+            heapq.heappush(self._schedule, (time.time() + interval, source))
@@ -0,0 +1,181 @@
+"""
+Hedged requests for idempotent reads
+
+When a request has not answered within a high percentile of recent
+latencies, a second identical request is sent and whichever succeeds first
+is used. Hedges are capped to a fraction of all requests, so they only cut
+the tail of the latency distribution instead of doubling the load.
+
+The primary runs in the calling thread while no hedge can be sent (too few
+latency samples or the budget spent). Otherwise it runs on a thread of its
+own, so the caller can return as soon as the backup wins, and only backups
+go through the worker pool.
+"""
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+__all__ = ["Hedger"]
+
+
+class Hedger:
+    """
+    Run a request with a delayed backup and keep the first good answer
+
+    Args:
+        percentile: float Latency percentile after which the hedge is sent
+        budget: float Most hedges as a fraction of all requests
+        min_samples: int Latencies needed before hedging starts
+        window: int Recent latencies the percentile is computed over
+        workers: int Threads running backup requests
+
+    Example:
+        api.set_hedger(Hedger(percentile=95, budget=0.05))
+        api.get_username_info(user_id)
+        print(api.metrics()['hedger'])
+    """
+
+    def __init__(
+            self,
+            percentile: float = 95.0,
+            budget: float = 0.05,
+            min_samples: int = 20,
+            window: int = 512,
+            workers: int = 32
+        ) -> None:
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.refused = 0
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging, None while there are too few samples
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def _within_budget(self) -> bool:
+        return self.hedged + 1 <= self.budget * self.requests
+
+    def _allow(self, allow: Callable[[], bool]) -> bool:
+        with self._lock:
+            if not self._within_budget():
+                return False
+            self.hedged += 1
+        if allow():
+            return True
+        with self._lock:
+            self.hedged -= 1
+            self.refused += 1
+        return False
+
+    @staticmethod
+    def _run(future: concurrent.futures.Future, function: Callable[[], Any]) -> None:
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(function())
+        except BaseException as e:
+            future.set_exception(e)
+
+    def call(
+            self,
+            primary: Callable[[], Any],
+            backup: Callable[[], Any],
+            ok: Callable[[Any], bool] = lambda result: True,
+            discard: Callable[[Any], None] = lambda result: None,
+            allow: Callable[[], bool] = lambda: True
+        ) -> Any:
+        """
+        Run `primary`, and `backup` as well if `primary` is slow
+
+        Args:
+            primary: Sends the request
+            backup: Sends the duplicate (e.g. through another proxy)
+            ok: Whether a result is good enough to win over a pending one
+            discard: Called with the losing result once it arrives
+            allow: Called in the calling thread right before the backup is
+                   sent; returning False skips the hedge (e.g. no rate
+                   limit token left). Must not block.
+
+        Returns the winning result, raises the primary's exception if both fail
+        """
+        delay = self.delay()
+        with self._lock:
+            self.requests += 1
+            inline = delay is None or not self._within_budget()
+        started = time.monotonic()
+        if inline:
+            result = primary()
+            self._record(time.monotonic() - started)
+            return result
+
+        first = concurrent.futures.Future()
+        threading.Thread(target=self._run, args=(first, primary), name='hedge-primary', daemon=True).start()
+        try:
+            result = first.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        else:
+            self._record(time.monotonic() - started)
+            return result
+
+        if not self._allow(allow):
+            result = first.result()
+            self._record(time.monotonic() - started)
+            return result
+
+        second = self._pool.submit(backup)
+        pending = {first, second}
+        winner = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and (ok(future.result()) or not pending):
+                    winner = future
+                    break
+            if winner is not None:
+                break
+        if winner is None:
+            return first.result()
+        # Still queued behind other backups: never send it
+        second.cancel()
+
+        self._record(time.monotonic() - started)
+        if winner is second:
+            with self._lock:
+                self.hedge_wins += 1
+        loser = second if winner is first else first
+
+        def drop(future):
+            if not future.cancelled() and future.exception() is None:
+                discard(future.result())
+
+        loser.add_done_callback(drop)
+        return winner.result()
+
+    def _record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'requests': self.requests,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'refused': self.refused,
+            'hedge_ratio': self.hedged / self.requests if self.requests else 0.0,
+            'delay': self.delay(),
+        }
@@ -1,11 +1,40 @@
 """
 Utility functions for working with images
 """
+import concurrent.futures
+import functools
+import hashlib
+import math
+import os
 import struct
 import imghdr
+from typing import Dict, Iterable, Optional
 
 from .exceptions import UnsupportedMediaType
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Feed posts must be between 4:5 portrait and 1.91:1 landscape
+MIN_ASPECT_RATIO = 4 / 5
+MAX_ASPECT_RATIO = 1.91
+# Instagram rescales photos to between 320 and 1080 pixels wide
+MIN_PHOTO_WIDTH = 320
+MAX_PHOTO_WIDTH = 1080
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 hex digest of a file, read in 1 MiB blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fhandle:
+        for block in iter(lambda: fhandle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 def get_image_size(path_to_file: str):
     """
     Get the size in bytes of an image file
@@ -38,3 +67,97 @@ def get_image_size(path_to_file: str):
         else:
             raise UnsupportedMediaType("Unsupported format")
         return width, height
+
+
+def normalize_image(
+        path: str,
+        output_dir: str,
+        quality: int = 87,
+        sha256: Optional[str] = None
+    ) -> str:
+    """
+    Convert an image to the JPEG Instagram would produce from it
+
+    Applies the EXIF rotation, flattens transparency onto white, center crops
+    to the allowed aspect ratio range, scales to 320-1080 pixels wide and
+    saves a JPEG without any metadata. Outputs are cached in `output_dir` by
+    the content hash of the source, so the same image is only converted once.
+
+    Args:
+        path: str Source image, any format Pillow can read
+        output_dir: str Directory for normalized images
+        quality: int JPEG quality
+        sha256: str Hash of the source file if it is already known
+
+    Returns the path of the normalized JPEG
+    """
+    if Image is None:
+        raise ImportError("Pillow is required to normalize images: pip install Pillow")
+
+    digest = sha256 or file_sha256(path)
+    output = os.path.join(output_dir, f'{digest}-q{quality}.jpg')
+    if os.path.exists(output):
+        return output
+
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        width, height = image.size
+        if width / height < MIN_ASPECT_RATIO:
+            new_height = int(width / MIN_ASPECT_RATIO)
+            top = (height - new_height) // 2
+            image = image.crop((0, top, width, top + new_height))
+        elif width / height > MAX_ASPECT_RATIO:
+            new_width = int(height * MAX_ASPECT_RATIO)
+            left = (width - new_width) // 2
+            image = image.crop((left, 0, left + new_width, height))
+
+        width, height = image.size
+        target_width = min(max(width, MIN_PHOTO_WIDTH), MAX_PHOTO_WIDTH)
+        if target_width != width:
+            target_height = round(height * target_width / width)
+            # Keep the aspect ratio inside the allowed range after rounding
+            target_height = min(
+                max(target_height, math.ceil(target_width / MAX_ASPECT_RATIO)),
+                math.floor(target_width / MIN_ASPECT_RATIO)
+            )
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+
+        os.makedirs(output_dir, exist_ok=True)
+        temporary = f'{output}.{os.getpid()}.tmp'
+        image.save(temporary, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(temporary, output)
+    return output
+
+
+def _normalize_or_error(path: str, output_dir: str, quality: int) -> object:
+    try:
+        return normalize_image(path, output_dir, quality)
+    except Exception as e:
+        return UnsupportedMediaType(f'{path}: {type(e).__name__}: {e}')
+
+
+def normalize_images(
+        paths: Iterable[str],
+        output_dir: str,
+        quality: int = 87,
+        processes: Optional[int] = None
+    ) -> Dict[str, object]:
+    """
+    Normalize many images in a process pool
+
+    Returns a dict mapping every source path to its normalized JPEG, or to
+    the exception raised while converting it.
+    """
+    paths = list(paths)
+    worker = functools.partial(_normalize_or_error, output_dir=output_dir, quality=quality)
+    chunksize = max(1, len(paths) // ((processes or os.cpu_count() or 1) * 4))
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        return dict(zip(paths, pool.map(worker, paths, chunksize=chunksize)))
@@ -4,6 +4,7 @@ Instagram API bindings written in python 3
 """
 
 import calendar
+import concurrent.futures
 import copy
 from datetime import datetime
 import hashlib
@@ -12,8 +13,9 @@ import json
 import logging
 import math
 import os
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import urllib.parse
 import uuid
 
@@ -21,12 +23,27 @@ import requests
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 from requests_toolbelt import MultipartEncoder
 
+from .circuit_breaker import CLOSED, CircuitBreaker
+from .friendships import SHOW_MANY_LIMIT, Friendship, parse_friendship_statuses
+from .hedging import Hedger
 from .image_utils import get_image_size
+from .json_stream import JSONArrayStream, loads
+from .models import Page
+from .proxy_pool import proxy_ok
+from .response_cache import ResponseCache
+from .scheduler import RequestScheduler
+from .single_flight import SingleFlight
+from .typeahead import TypeaheadIndex, local_response, search_ids
+from .username_index import UsernameIndex
 from .exceptions import (
     AlbumLengthError,
-    SentryBlockException,
+    LoginRequiredException,
     NoLoginException,
-    UnsupportedMediaType
+    NotFoundException,
+    RequestFailedException,
+    TransientException,
+    UnsupportedMediaType,
+    classify_error
 )
 
 # Turn off InsecureRequestWarning
@@ -66,6 +83,8 @@ class InstagramAPI:
     with open(r"InstagramAPI\EXPERIMENTS.txt", mode='r') as experiments:
         EXPERIMENTS = experiments.read()
     SIG_KEY_VERSION = '4'
+    # Max user ids per feed/reels_media/ request
+    REELS_MEDIA_LIMIT = 20
 
     # username            # Instagram username
     # password            # Instagram password
@@ -83,17 +102,51 @@ class InstagramAPI:
         ) -> None:
 
         m = hashlib.md5()
-        m.update(username + password)
+        m.update((username + password).encode())
         self.device_id = self.generate_device_id(m.hexdigest())
 
+        # last_response/last_json are kept per thread, so threads sharing a
+        # client each see the result of their own request
+        self._local = threading.local()
         self.is_logged_in = False
         self.last_response = None
         self.session = requests.Session()
+        self.proxy_pool = None
+        self.scheduler: Optional[RequestScheduler] = None
+        self.hedger: Optional[Hedger] = None
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        self.response_cache: Optional[ResponseCache] = None
+        self.username_index: Optional[UsernameIndex] = None
+        self.typeahead_index: Optional[TypeaheadIndex] = None
+        self.single_flight = SingleFlight()
 
         self.username = username
         self.password = password
         self.uuid = self.generate_UUID(with_dashes=True)
 
+    @property
+    def last_response(self):
+        return getattr(self._local, 'last_response', None)
+
+    @last_response.setter
+    def last_response(self, response) -> None:
+        self._local.last_response = response
+
+    @property
+    def last_json(self):
+        return getattr(self._local, 'last_json', None)
+
+    @last_json.setter
+    def last_json(self, value) -> None:
+        self._local.last_json = value
+
+    @property
+    def last_page(self) -> Page:
+        """
+        `last_json` wrapped in a Page, e.g. `api.last_page.users[0].username`
+        """
+        return Page(self.last_json or {})
+
     def set_proxy(self, proxy: str) -> None:
         """
         Set proxy for all requests
@@ -107,6 +160,185 @@ class InstagramAPI:
         self.session.proxies.update(proxies)
         logging.info(f"Set proxy to {proxies}")
 
+    def set_proxy_pool(self, pool) -> None:
+        """
+        Pick the proxy of every request from a ProxyPool
+
+        Requests report their latency and outcome to the pool, and a request
+        failing on one proxy is retried right away on another instead of
+        waiting 60 seconds.
+
+        Args:
+            pool: ProxyPool Pool to use, None to go back to `set_proxy`
+        """
+        self.proxy_pool = pool
+
+    def set_scheduler(self, scheduler: Optional[RequestScheduler]) -> None:
+        """
+        Take a slot from a RequestScheduler before sending every request
+
+        Threads pick their priority class with `scheduler.priority(...)`, so
+        interactive calls are sent ahead of queued background pages within
+        the account's rate budget.
+
+        Args:
+            scheduler: RequestScheduler Scheduler to use, None to send right away
+        """
+        self.scheduler = scheduler
+
+    def set_hedger(self, hedger: Optional[Hedger]) -> None:
+        """
+        Hedge GET requests with a Hedger
+
+        A GET still unanswered after the hedger's latency percentile is sent
+        a second time, through another proxy of the pool when one is set, and
+        the first good response is used. Writes are never hedged. The second
+        request takes a scheduler slot without waiting for one and is only
+        sent while the circuit breaker is closed.
+
+        Args:
+            hedger: Hedger Hedger to use, None to send every request once
+        """
+        self.hedger = hedger
+
+    def set_circuit_breaker(self, breaker: Optional[CircuitBreaker]) -> None:
+        """
+        Stop sending requests while the account keeps failing
+
+        Once the CircuitBreaker opens, requests (including those queued in the
+        scheduler) raise CircuitOpenException instead of being sent, until a
+        probe request succeeds.
+
+        Args:
+            breaker: CircuitBreaker Breaker of this account, None to always send
+        """
+        self.circuit_breaker = breaker
+
+    def set_response_cache(self, cache: Optional[ResponseCache]) -> None:
+        """
+        Answer repeated idempotent reads (user info, friendship, media info,
+        tag and location search) from a ResponseCache
+
+        Writes sent through this client (likes, follows, edits...) drop the
+        cached reads they make stale. A cache hit leaves `last_response` as
+        None, since no request was sent.
+
+        Args:
+            cache: ResponseCache Cache to use, None to disable caching
+        """
+        self.response_cache = cache
+
+    def set_username_index(self, index: Optional[UsernameIndex]) -> None:
+        """
+        Record the username/pk pairs of every response in a UsernameIndex
+
+        Follower, feed, comment etc. responses then fill the index as a side
+        effect, and `resolve_usernames` uses it.
+
+        Args:
+            index: UsernameIndex Index to use, None to stop recording
+        """
+        self.username_index = index
+
+    def set_typeahead_index(self, index: Optional[TypeaheadIndex]) -> None:
+        """
+        Answer search_users, search_tags, search_location and fb_user_search
+        from a TypeaheadIndex when it covers the query
+
+        Every response then adds the users, hashtags and places it contains
+        to the index.
+
+        Args:
+            index: TypeaheadIndex Index to use, None to always search online
+        """
+        self.typeahead_index = index
+
+    def resolve_usernames(self, usernames: List[str], workers: int = 8) -> Dict[str, Any]:
+        """
+        Map usernames to pks
+
+        Known usernames are answered from the username index, the others are
+        looked up with `search_username`, `workers` at a time. Without an
+        index set, every username is looked up through a throwaway index.
+
+        Returns {username: pk}, leaving out usernames that do not resolve
+        """
+        if self.username_index is not None:
+            return self.username_index.resolve(self, usernames, workers)
+        index = UsernameIndex(':memory:')
+        try:
+            return index.resolve(self, usernames, workers)
+        finally:
+            index.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Counters of the request layer: coalesced calls, cache hit ratio and
+        the health of every proxy
+        """
+        metrics: Dict[str, Any] = {'single_flight': self.single_flight.stats()}
+        if self.response_cache is not None:
+            metrics['response_cache'] = self.response_cache.stats()
+        if self.username_index is not None:
+            metrics['username_index'] = self.username_index.stats()
+        if self.typeahead_index is not None:
+            metrics['typeahead_index'] = self.typeahead_index.stats()
+        if self.scheduler is not None:
+            metrics['scheduler'] = self.scheduler.stats()
+        if self.hedger is not None:
+            metrics['hedger'] = self.hedger.stats()
+        if self.circuit_breaker is not None:
+            metrics['circuit_breaker'] = self.circuit_breaker.stats()
+        if self.proxy_pool is not None:
+            metrics['proxy_pool'] = [stats.as_dict() for stats in self.proxy_pool.stats.values()]
+        return metrics
+
+    def save_session(self, path: str) -> None:
+        """
+        Persist cookies and device identifiers of a logged in session
+
+        The password is not stored. Restore with `InstagramAPI.from_session`.
+
+        Args:
+            path: str File to write the session to
+        """
+        if not self.is_logged_in:
+            raise NoLoginException("You are not currently logged in. "
+                                   "Try running InstagramAPI.login()")
+        data = {
+            'username': self.username,
+            'uuid': self.uuid,
+            'device_id': self.device_id,
+            'username_id': self.username_id,
+            'rank_token': self.rank_token,
+            'token': self.token,
+            'cookies': requests.utils.dict_from_cookiejar(self.session.cookies),
+        }
+        with open(path, 'w') as session_file:
+            json.dump(data, session_file)
+
+    @classmethod
+    def from_session(cls, path: str, password: str = '') -> 'InstagramAPI':
+        """
+        Create a logged in client from a file written by `save_session`
+
+        Args:
+            path: str Session file
+            password: str Account password, only needed for `change_password`
+        """
+        with open(path, 'r') as session_file:
+            data = json.load(session_file)
+
+        api = cls(data['username'], password)
+        api.uuid = data['uuid']
+        api.device_id = data['device_id']
+        api.username_id = data['username_id']
+        api.rank_token = data['rank_token']
+        api.token = data['token']
+        api.session.cookies = requests.utils.cookiejar_from_dict(data['cookies'])
+        api.is_logged_in = True
+        return api
+
     def login(self) -> bool:
         """
         Login to Instagram account
@@ -172,7 +404,19 @@ class InstagramAPI:
         """
         self.send_request('accounts/logout/')
 
-    def upload_photo(self, photo, caption=None, upload_id=None, is_sidecar=None):
+    def upload_photo(self, photo, caption=None, upload_id=None, is_sidecar=None, size=None):
+        """
+        Upload photo to Instagram
+
+        Args:
+            photo: str Path to image file
+            caption: str Post caption
+            upload_id:
+            is_sidecar: bool Is part of carousel/a post with multiple videos
+                             or photos
+            size: Tuple[int, int] (width, height) if already known, saves
+                  reading the image header again
+        """
         if upload_id is None:
             upload_id = str(int(time.time() * 1000))
 
@@ -208,8 +452,9 @@ class InstagramAPI:
         response = self.session.post(f"{self.API_URL}upload/photo/", data=m.to_string())
 
         if response.status_code == 200:
-            if self.configure(upload_id, photo, caption):
+            if self.configure(upload_id, photo, caption, size=size):
                 self.expose()
+                return True
         return False
 
     def upload_video(
@@ -219,7 +464,7 @@ class InstagramAPI:
             caption: Optional[str] = None,
             upload_id: Optional[str] = None,
             is_sidecar: Optional[bool] = None
-        ) -> None:
+        ) -> bool:
         """
         Upload video to Instagram
 
@@ -261,7 +506,7 @@ class InstagramAPI:
         response = self.session.post(f"{self.API_URL}upload/video/", data=m.to_string())
 
         if response.status_code == 200:
-            body = json.loads(response.text)
+            body = loads(response.content)
             upload_url = body['video_upload_urls'][3]['url']
             upload_job = body['video_upload_urls'][3]['job']
 
@@ -306,6 +551,8 @@ class InstagramAPI:
             if response.status_code == 200:
                 if self.configure_video(upload_id, path_to_video, path_to_thumbnail, caption):
                     self.expose()
+                    return True
+        return False
 
     def upload_album(self,
                      media: List[Dict[str, Any]],
@@ -504,22 +751,12 @@ class InstagramAPI:
             'caption': caption_text,
             'children_metadata': children_metadata
         }
-        self.send_request(endpoint, self.generate_signature(json.dumps(data)))
-        response = self.last_response
-        if response.status_code == 200:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
-            return True
-        print(f"Request return {response.status_code} error!")
-        # for debugging
-        self.last_response = response
-        self.last_json = json.loads(response.text)
-        return False
+        return self.send_request(endpoint, self.generate_signature(json.dumps(data)))
 
     def direct_message(self, text, recipients):
         if not isinstance(recipients, (list, tuple, set)):
             recipients = [str(recipients)]
-        recipient_users = '"",""'.join(str(r) for r in recipients)
+        recipient_users = '","'.join(str(r) for r in recipients)
         endpoint = 'direct_v2/threads/broadcast/text/'
         boundary = self.uuid
         bodies = [
@@ -545,35 +782,12 @@ class InstagramAPI:
             },
         ]
         data = self.build_body(bodies, boundary)
-        self.session.headers.update({
-            'User-Agent': self.USER_AGENT,
-            'Proxy-Connection': 'keep-alive',
-            'Connection': 'keep-alive',
-            'Accept': '*/*',
-            'Content-Type': 'multipart/form-data; boundary={}'.format(boundary),
-            'Accept-Language': 'en-en'
-        })
-        #self.send_request(endpoint,post=data) #overwrites 'Content-type' header and boundary is missed
-        response = self.session.post(self.API_URL + endpoint, data=data)
-
-        if response.status_code == 200:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
-            return True
-
-        print (f"Request return {response.status_code} error!")
-        # for debugging
-        try:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
-        except:
-            pass
-        return False
+        return self.send_request(endpoint, data.encode(), headers=self.multipart_headers(boundary))
 
     def direct_share(self, media_id, recipients, text=None):
-        if not isinstance(position, list):
+        if not isinstance(recipients, (list, tuple, set)):
             recipients = [str(recipients)]
-        recipient_users = '"",""'.join(str(r) for r in recipients)
+        recipient_users = '","'.join(str(r) for r in recipients)
         endpoint = 'direct_v2/threads/broadcast/media_share/?media_type=photo'
         boundary = self.uuid
         bodies = [
@@ -604,30 +818,7 @@ class InstagramAPI:
             },
         ]
         data = self.build_body(bodies, boundary)
-        self.session.headers.update({
-            'User-Agent': self.USER_AGENT,
-            'Proxy-Connection': 'keep-alive',
-            'Connection': 'keep-alive',
-            'Accept': '*/*',
-            'Content-Type': 'multipart/form-data; boundary={}'.format(boundary),
-            'Accept-Language': 'en-en'
-        })
-        # self.send_request(endpoint,post=data) #overwrites 'Content-type' header and boundary is missed
-        response = self.session.post(self.API_URL + endpoint, data=data)
-
-        if response.status_code == 200:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
-            return True
-
-        print(f"Request return {response.status_code} error!")
-        # for debugging
-        try:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
-        except:
-            pass
-        return False
+        return self.send_request(endpoint, data.encode(), headers=self.multipart_headers(boundary))
 
     def configure_video(self, upload_id, video, thumbnail, caption=''):
         clip = VideoFileClip(video)
@@ -660,8 +851,8 @@ class InstagramAPI:
             post=self.generate_signature(data)
         )
 
-    def configure(self, upload_id, photo, caption=''):
-        (w, h) = get_image_size(photo)
+    def configure(self, upload_id, photo, caption='', size=None):
+        (w, h) = size or get_image_size(photo)
         data = json.dumps({
             '_csrftoken': self.token,
             'media_folder': 'Instagram',
@@ -716,7 +907,12 @@ class InstagramAPI:
             '_csrftoken': self.token,
             'media_id': media_id
         })
-        return self.send_request(f'media/{media_id}/info/', self.generate_signature(data))
+        return self.send_request(
+            f'media/{media_id}/info/',
+            self.generate_signature(data),
+            coalesce=True,
+            cache=('media/{}/info/', media_id)
+        )
 
     def delete_media(self, media_id, media_type=1):
         data = json.dumps({
@@ -857,8 +1053,81 @@ class InstagramAPI:
     def get_story(self, username_id):
         return self.send_request(f'feed/user/{username_id}/reel_media/')
 
+    def get_reels_tray(self):
+        return self.send_request('feed/reels_tray/')
+
+    def get_stories(
+            self,
+            user_ids: List[Any],
+            seen: Optional[Dict[str, int]] = None,
+            workers: int = 4
+        ) -> Dict[Any, Dict[str, Any]]:
+        """
+        Story reels of many users, REELS_MEDIA_LIMIT users per request
+
+        Args:
+            user_ids: List User pks
+            seen: Dict[str, int] {user_id: latest_reel_media} of the reels
+                  already fetched, updated in place. When given, users whose
+                  tray entry shows no newer story are not requested, and only
+                  new or changed reels are returned
+            workers: int Requests in flight at once
+
+        Returns {user_id: reel}, keyed by the ids as passed in. Users without
+        an active story are left out.
+
+        Example:
+            seen = {}
+            while True:
+                for user_id, reel in api.get_stories(watch_list, seen).items():
+                    ...
+                time.sleep(300)
+        """
+        ids = {str(user_id): user_id for user_id in user_ids}
+        wanted = list(ids)
+        if seen and self.get_reels_tray():
+            tray = {
+                str(reel['id']): reel.get('latest_reel_media') or 0
+                for reel in self.last_json.get('tray', [])
+            }
+            # Users missing from the tray (e.g. not followed) are requested anyway
+            wanted = [user_id for user_id in wanted if tray.get(user_id, math.inf) > seen.get(user_id, 0)]
+        batches = [wanted[i:i + self.REELS_MEDIA_LIMIT] for i in range(0, len(wanted), self.REELS_MEDIA_LIMIT)]
+
+        def fetch(batch: List[str]) -> Dict[str, Any]:
+            data = json.dumps({
+                '_uuid': self.uuid,
+                '_uid': self.username_id,
+                '_csrftoken': self.token,
+                'user_ids': batch,
+                'source': 'feed_timeline'
+            })
+            try:
+                ok = self.send_request('feed/reels_media/', self.generate_signature(data))
+            except RequestFailedException as e:
+                logging.warning(f"feed/reels_media/ failed for {len(batch)} users: {e!r}")
+                return {}
+            if not ok:
+                logging.warning(f"feed/reels_media/ failed for {len(batch)} users")
+                return {}
+            return self.last_json.get('reels') or {}
+
+        result: Dict[Any, Dict[str, Any]] = {}
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            for reels in pool.map(fetch, batches):
+                for user_id, reel in reels.items():
+                    if user_id not in ids:
+                        continue
+                    if seen is not None:
+                        latest = reel.get('latest_reel_media') or 0
+                        if latest <= seen.get(user_id, 0):
+                            continue
+                        seen[user_id] = latest
+                    result[ids[user_id]] = reel
+        return result
+
     def get_username_info(self, username_id):
-        return self.send_request(f'users/{username_id}/info/')
+        return self.send_request(f'users/{username_id}/info/', coalesce=True, cache=('users/{}/info/', username_id))
 
     def get_self_username_info(self):
         return self.get_username_info(self.username_id)
@@ -874,8 +1143,11 @@ class InstagramAPI:
         activity = self.send_request('news/?')
         return activity
 
-    def get_v2_inbox(self):
-        inbox = self.send_request('direct_v2/inbox/?')
+    def get_v2_inbox(self, cursor=None):
+        endpoint = 'direct_v2/inbox/?'
+        if cursor is not None:
+            endpoint += f'cursor={cursor}'
+        inbox = self.send_request(endpoint)
         return inbox
 
     def get_v2_threads(self, thread, cursor=None):
@@ -885,6 +1157,58 @@ class InstagramAPI:
         inbox = self.send_request(endpoint)
         return inbox
 
+    def iter_inbox_pages(self, cursor=None) -> Iterator[Tuple[Optional[str], List[Dict[str, Any]]]]:
+        """
+        Yield (next cursor, threads) for every direct inbox page, newest first
+
+        The cursor is None on the last page. Pass a stored cursor to resume
+        after the page it came with.
+
+        Raises RuntimeError when a page request fails with an error of no
+        known kind, and the RequestFailedException subclass of the others.
+        """
+        while True:
+            if not self.get_v2_inbox(cursor):
+                raise RuntimeError(f'Inbox page request failed at cursor {cursor}')
+            inbox = self.last_json.get('inbox') or {}
+            cursor = inbox.get('oldest_cursor') if inbox.get('has_older') else None
+            yield cursor, inbox.get('threads', [])
+            if cursor is None:
+                return
+
+    def iter_inbox_threads(self, cursor=None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every thread of the direct inbox, most recently active first
+        """
+        for _, threads in self.iter_inbox_pages(cursor):
+            yield from threads
+
+    def iter_thread_pages(self, thread_id, cursor=None) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Yield (next cursor, thread page) for every page of a direct thread
+
+        Pages go from the newest items to the oldest. The cursor is None on
+        the last page; pass a stored cursor to resume after its page.
+
+        Raises RuntimeError when a page request fails with an error of no
+        known kind, and the RequestFailedException subclass of the others.
+        """
+        while True:
+            if not self.get_v2_threads(thread_id, cursor):
+                raise RuntimeError(f'Thread {thread_id} page request failed at cursor {cursor}')
+            thread = self.last_json.get('thread') or {}
+            cursor = thread.get('oldest_cursor') if thread.get('has_older') else None
+            yield cursor, thread
+            if cursor is None:
+                return
+
+    def iter_thread_items(self, thread_id, cursor=None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every item (message, share, like...) of a direct thread, newest first
+        """
+        for _, thread in self.iter_thread_pages(thread_id, cursor):
+            yield from thread.get('items', [])
+
     def get_user_tags(self, username_id):
         tags = self.send_request(f'usertags/{username_id}/feed/?rank_token={self.rank_token}&ranked_content=true&')
         return tags
@@ -907,23 +1231,64 @@ class InstagramAPI:
     def get_self_geo_media(self):
         return self.get_geo_media(self.username_id)
 
+    def _typeahead_search(self, kind: str, query: str, endpoint: str, cache=None) -> bool:
+        index = self.typeahead_index
+        if index is not None:
+            entries = index.lookup(kind, query)
+            if entries is not None:
+                self.last_response = None
+                self.last_json = local_response(kind, entries)
+                return True
+        ok = self.send_request(endpoint, cache=cache)
+        if ok and index is not None:
+            if self.last_response is None:
+                # Answered by the response cache, send_request recorded nothing
+                index.record_response(self.last_json)
+            index.record_search(kind, query, search_ids(kind, self.last_json), not self.last_json.get('has_more'))
+        return ok
+
     def fb_user_search(self, query):
-        query = self.send_request(f'fbsearch/topsearch/?context=blended&query={query}&rank_token={self.rank_token}')
-        return query
+        index = self.typeahead_index
+        if index is not None:
+            found = {kind: index.lookup(kind, query) for kind in ('users', 'tags', 'places')}
+            if all(entries is not None for entries in found.values()):
+                self.last_response = None
+                self.last_json = {
+                    'users': [{'position': i, 'user': user} for i, user in enumerate(found['users'])],
+                    'hashtags': [{'position': i, 'hashtag': tag} for i, tag in enumerate(found['tags'])],
+                    'places': [{'position': i, 'place': {'location': place, 'title': place.get('name')}} for i, place in enumerate(found['places'])],
+                    'status': 'ok'
+                }
+                return True
+        ok = self.send_request(f'fbsearch/topsearch/?context=blended&query={query}&rank_token={self.rank_token}')
+        if ok and index is not None:
+            # Blended results are truncated, so they only cover this exact query
+            data = self.last_json
+            index.record_search('users', query, [u['user']['pk'] for u in data.get('users', [])], False)
+            index.record_search('tags', query, [h['hashtag']['name'].lower() for h in data.get('hashtags', [])], False)
+            index.record_search('places', query, [p['place']['location']['pk'] for p in data.get('places', [])], False)
+        return ok
 
     def search_users(self, query):
-        query = self.send_request(f'users/search/?ig_sig_key_version={self.SIG_KEY_VERSION}&is_typeahead=true&query={query}&rank_token={self.rank_token}')
-        return query
+        return self._typeahead_search(
+            'users',
+            query,
+            f'users/search/?ig_sig_key_version={self.SIG_KEY_VERSION}&is_typeahead=true&query={query}&rank_token={self.rank_token}'
+        )
 
     def search_username(self, username: str):
-        return self.send_request(f'users/{username}/usernameinfo/')
+        return self.send_request(f'users/{username}/usernameinfo/', coalesce=True, cache=('users/{}/usernameinfo/', username))
 
     def sync_from_adress_book(self, contacts):
         return self.send_request('address_book/link/?include=extra_display_name,thumbnails', "contacts=" + json.dumps(contacts))
 
     def search_tags(self, query):
-        query = self.send_request(f'tags/search/?is_typeahead=true&q={query}&rank_token={self.rank_token}')
-        return query
+        return self._typeahead_search(
+            'tags',
+            query,
+            f'tags/search/?is_typeahead=true&q={query}&rank_token={self.rank_token}',
+            cache=('tags/search/', query)
+        )
 
     def get_timeline(self):
         query = self.send_request(f'feed/timeline/?rank_token={self.rank_token}&ranked_content=true&')
@@ -942,13 +1307,37 @@ class InstagramAPI:
     def get_self_user_feed(self, max_id='', min_timestamp=None):
         return self.get_user_feed(self.username_id, max_id, min_timestamp)
 
+    def iter_user_feed(self, username_id, min_timestamp=None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every item of a user feed, fetching pages as they are needed
+
+        Raises RuntimeError when a page request fails with an error of no
+        known kind, and the RequestFailedException subclass of the others.
+        """
+        next_max_id = ''
+        while True:
+            if not self.get_user_feed(username_id, next_max_id, min_timestamp):
+                raise RuntimeError(f'Feed page request for {username_id} failed')
+            page = self.last_json
+            yield from page.get('items', [])
+            next_max_id = page.get('next_max_id')
+            if not page.get('more_available') or not next_max_id:
+                return
+
+    def iter_self_user_feed(self, min_timestamp=None) -> Iterator[Dict[str, Any]]:
+        return self.iter_user_feed(self.username_id, min_timestamp)
+
     def get_hashtag_feed(self, hashtag: str, max_id=None):
         max_id = max_id or ''
         return self.send_request(f'feed/tag/{hashtag}/?max_id={max_id}&rank_token={self.rank_token}&ranked_content=true&')
 
     def search_location(self, query):
-        location_feed = self.send_request(f'fbsearch/places/?rank_token={self.rank_token}&query={query}')
-        return location_feed
+        return self._typeahead_search(
+            'places',
+            query,
+            f'fbsearch/places/?rank_token={self.rank_token}&query={query}',
+            cache=('fbsearch/places/', query)
+        )
 
     def get_location_feed(self, location_id, max_id=''):
         return self.send_request(f'feed/location/{location_id}/?max_id={max_id}&rank_token={self.rank_token}&ranked_content=true&')
@@ -1119,20 +1508,81 @@ class InstagramAPI:
         })
         return self.send_request(
             endpoint=f'friendships/show/{user_id}/',
-            post=self.generate_signature(data)
+            post=self.generate_signature(data),
+            cache=('friendships/show/{}/', user_id)
         )
 
+    def user_friendships(self, user_ids: List[Any], workers: int = 4) -> Dict[Any, Friendship]:
+        """
+        Friendship status with many users at once, through friendships/show_many/
+
+        Ids are sent SHOW_MANY_LIMIT per request, `workers` requests at a
+        time, instead of one signed request per user.
+
+        Args:
+            user_ids: List User pks
+            workers: int Requests in flight at once
+
+        Returns {user_id: Friendship}, keyed by the ids as passed in. Users in
+        a chunk whose request failed are left out.
+        """
+        ids = {str(user_id): user_id for user_id in user_ids}
+        keys = list(ids)
+        chunks = [keys[i:i + SHOW_MANY_LIMIT] for i in range(0, len(keys), SHOW_MANY_LIMIT)]
+
+        def fetch(chunk: List[str]) -> Dict[str, Friendship]:
+            data = urllib.parse.urlencode({
+                '_uuid': self.uuid,
+                'user_ids': ','.join(chunk),
+                '_csrftoken': self.token
+            })
+            try:
+                ok = self.send_request('friendships/show_many/', data)
+            except RequestFailedException as e:
+                logging.warning(f"friendships/show_many/ failed for {len(chunk)} users: {e!r}")
+                return {}
+            if not ok:
+                logging.warning(f"friendships/show_many/ failed for {len(chunk)} users")
+                return {}
+            return parse_friendship_statuses(self.last_json)
+
+        result: Dict[Any, Friendship] = {}
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            for statuses in pool.map(fetch, chunks):
+                for user_id, friendship in statuses.items():
+                    if user_id in ids:
+                        result[ids[user_id]] = friendship
+        return result
+
     def get_liked_media(self, max_id=''):
         return self.send_request(f'feed/liked/?max_id={max_id}')
 
     def generate_signature(self, data):
         parsed_data = urllib.parse.quote(data)
-        return f'ig_sig_key_version={self.SIG_KEY_VERSION}&signed_body=' + hmac.new(self.IG_SIG_KEY, data, hashlib.sha256).hexdigest() + '.' + parsed_data
+        return f'ig_sig_key_version={self.SIG_KEY_VERSION}&signed_body=' + hmac.new(self.IG_SIG_KEY.encode(), data.encode(), hashlib.sha256).hexdigest() + '.' + parsed_data
+
+    def generate_signatures(self, datas: List[str]) -> List[str]:
+        """
+        Sign many payloads at once
+
+        The keyed HMAC state is set up once and copied for every payload.
+
+        Args:
+            datas: List[str] JSON payloads, as passed to `generate_signature`
+        """
+        keyed = hmac.new(self.IG_SIG_KEY.encode(), digestmod=hashlib.sha256)
+        prefix = f'ig_sig_key_version={self.SIG_KEY_VERSION}&signed_body='
+        signatures = []
+        for data in datas:
+            signer = keyed.copy()
+            signer.update(data.encode())
+            signatures.append(prefix + signer.hexdigest() + '.' + urllib.parse.quote(data))
+        return signatures
 
     def generate_device_id(self, seed):
         volatile_seed = "12345"
         m = hashlib.md5()
-        m.update(seed + volatile_seed)
+        m.update((seed + volatile_seed).encode())
         return 'android-' + m.hexdigest()[:16]
 
     def generate_UUID(self, with_dashes):
@@ -1188,6 +1638,20 @@ class InstagramAPI:
         })
         return self.send_request(f'live/{broadcast_id}/add_to_post_live/', self.generate_signature(data))
 
+    def multipart_headers(self, boundary: str) -> Dict[str, str]:
+        """
+        Headers of a multipart request, passed per request so the shared
+        session headers stay untouched
+        """
+        return {
+            'User-Agent': self.USER_AGENT,
+            'Proxy-Connection': 'keep-alive',
+            'Connection': 'keep-alive',
+            'Accept': '*/*',
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Accept-Language': 'en-en'
+        }
+
     def build_body(self, bodies, boundary):
         body = ''
         for b in bodies:
@@ -1208,10 +1672,53 @@ class InstagramAPI:
     def send_request(self,
                      endpoint: str,
                      post=None,
-                     login=False) -> bool:
+                     login=False,
+                     coalesce=False,
+                     cache: Optional[Tuple[str, Any]] = None,
+                     headers: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Send a request to the API, the decoded response ends up in `last_json`
+
+        Args:
+            endpoint: str API endpoint, relative to `API_URL`
+            post: Request body, sends a GET request when None
+            login: bool
+            coalesce: bool Share one in-flight request between threads asking
+                      for the same endpoint and body at the same time. Only
+                      for reads; callers then share the same `last_json`
+            cache: Tuple[str, Any] (endpoint template, parameter) the response
+                   is cached under when a response cache is set. Only for reads
+            headers: Dict[str, str] Headers of this request only, on top of
+                     the session headers
+
+        Returns False for an error response of no known kind. Raises
+        CheckpointRequiredException, LoginRequiredException,
+        RateLimitException, NotFoundException, TransientException or
+        SentryBlockException for the errors they describe, and
+        CircuitOpenException when the circuit breaker rejects the request.
+        """
+        if cache is not None and self.response_cache is not None:
+            body = self.response_cache.get(*cache, scope=self.username)
+            if body is not None:
+                self.last_response = None
+                self.last_json = loads(body)
+                return True
+            ok = self.send_request(endpoint, post, login, coalesce, headers=headers)
+            if ok:
+                self.response_cache.put(*cache, self.last_response.content, scope=self.username)
+            return ok
+
+        if coalesce:
+            def request():
+                ok = self.send_request(endpoint, post, login, headers=headers)
+                return ok, self.last_response, self.last_json
+
+            ok, self.last_response, self.last_json = self.single_flight.do((endpoint, post), request)
+            return ok
+
         verify = False  # don't show request warning
 
-        if not self.is_logged_in or login:
+        if not self.is_logged_in and not login:
             raise NoLoginException("You are not currently logged in. "
                                    "Try running InstagramAPI.login()")
 
@@ -1224,76 +1731,181 @@ class InstagramAPI:
             'User-Agent': self.USER_AGENT
         })
 
-        while True:
+        def attempt(proxy: Optional[str], stream: bool = False):
+            proxies = {'http': proxy, 'https': proxy} if proxy is not None else None
+            timeout = self.proxy_pool.request_timeout if proxy is not None else None
+            started = time.monotonic()
             try:
                 if post is not None:
-                    response = self.session.post(self.API_URL + endpoint, data=post, verify=verify)
+                    response = self.session.post(self.API_URL + endpoint, data=post, headers=headers, verify=verify, proxies=proxies, timeout=timeout)
                 else:
-                    response = self.session.get(self.API_URL + endpoint, verify=verify)
+                    response = self.session.get(self.API_URL + endpoint, headers=headers, verify=verify, proxies=proxies, timeout=timeout, stream=stream)
+            except Exception:
+                if proxy is not None:
+                    self.proxy_pool.report(proxy, time.monotonic() - started, ok=False)
+                raise
+            if proxy is not None:
+                self.proxy_pool.report(proxy, time.monotonic() - started, ok=proxy_ok(response.status_code))
+            return response
+
+        breaker = self.circuit_breaker
+
+        def hedge_allowed() -> bool:
+            # The duplicate is a request like any other: not while the
+            # breaker is probing or open, and only with a free scheduler slot
+            if breaker is not None and breaker.state != CLOSED:
+                return False
+            return self.scheduler is None or self.scheduler.try_acquire()
+
+        failed = None
+        while True:
+            if breaker is not None:
+                breaker.check()
+            if self.scheduler is not None:
+                self.scheduler.acquire()
+            if breaker is not None:
+                # Queued requests fail here if the breaker opened meanwhile
+                breaker.before_request()
+            # A retry goes through another proxy than the one that just raised,
+            # even while that one is still the account's sticky proxy
+            proxy = self.proxy_pool.select(self.username, exclude=failed) if self.proxy_pool is not None else None
+            try:
+                if post is None and self.hedger is not None:
+                    # Streamed, so closing the losing response drops its
+                    # connection instead of downloading the body
+                    response = self.hedger.call(
+                        lambda: attempt(proxy, stream=True),
+                        lambda: attempt(self.proxy_pool.select(self.username, exclude=proxy) if proxy is not None else None, stream=True),
+                        ok=lambda response: response.status_code < 500,
+                        discard=lambda response: response.close(),
+                        allow=hedge_allowed,
+                    )
+                else:
+                    response = attempt(proxy)
             except Exception as e:
-                print(f'Except on send_request (wait 60 sec and resend): {e}')
-                time.sleep(60)
+                if breaker is not None:
+                    breaker.record_failure(TransientException(str(e)))
+                if proxy is None:
+                    print(f'Except on send_request (wait 60 sec and resend): {e}')
+                    time.sleep(60)
+                    continue
+                print(f'Except on send_request through {proxy} (resend through another proxy): {e}')
+                failed = proxy
+                time.sleep(self.proxy_pool.retry_delay())
             else:
                 break
 
+        self.last_response = response
+        if post is not None and self.response_cache is not None:
+            self.response_cache.invalidate_write(endpoint, scope=self.username)
         if response.status_code == 200:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
+            if breaker is not None:
+                breaker.record_success()
+            self.last_json = loads(response.content)
+            if self.username_index is not None:
+                self.username_index.record_response(self.last_json)
+            if self.typeahead_index is not None:
+                self.typeahead_index.record_response(self.last_json)
             return True
 
+        self._raise_for_error(response)
+        return False
+
+    def _raise_for_error(self, response) -> None:
+        """
+        Decode an error response into `last_json`, report it to the circuit
+        breaker and raise it if it is of a known kind
+        """
         print(f"Request return {response.status_code} error!")
         # for debugging
         try:
-            self.last_response = response
-            self.last_json = json.loads(response.text)
+            self.last_json = loads(response.content)
             print(self.last_json)
-            if 'error_type' in self.last_json and self.last_json['error_type'] == 'sentry_block':
-                raise SentryBlockException(self.last_json['message'])
-        except SentryBlockException:
-            raise
-        except:
-            pass
-        return False
+        except ValueError:
+            # Never leave the previous page in last_json
+            self.last_json = {}
+
+        retry_after = response.headers.get('Retry-After', '')
+        error = classify_error(response.status_code, self.last_json, float(retry_after) if retry_after.isdigit() else None)
+        if self.circuit_breaker is not None:
+            if error is None or isinstance(error, NotFoundException):
+                self.circuit_breaker.record_success()
+            else:
+                self.circuit_breaker.record_failure(error)
+        if isinstance(error, LoginRequiredException):
+            self.is_logged_in = False
+        if error is not None:
+            raise error
 
-    def get_total_followers(self, username_id):
-        followers = []
-        next_max_id = ''
-        while 1:
-            self.get_user_followers(username_id, next_max_id)
-            temp = self.last_json
+    def stream_request(self, endpoint: str, key: str) -> Iterator[Any]:
+        """
+        Send a GET request and yield the `key` list as it is decoded
+
+        Elements are decoded one at a time from the raw byte stream instead of
+        building the whole page first. Once the generator is exhausted the rest
+        of the page (`next_max_id`, `big_list`, ...) is in `last_json`.
 
-            for item in temp["users"]:
-                followers.append(item)
+        Args:
+            endpoint: str API endpoint, relative to `API_URL`
+            key: str Top-level list to stream, e.g. 'users' or 'items'
+        """
+        if not self.is_logged_in:
+            raise NoLoginException("You are not currently logged in. "
+                                   "Try running InstagramAPI.login()")
 
-            if temp["big_list"] is False:
-                return followers
-            next_max_id = temp["next_max_id"]
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.check()
+        if self.scheduler is not None:
+            self.scheduler.acquire()
+        if breaker is not None:
+            breaker.before_request()
+        try:
+            response = self.session.get(self.API_URL + endpoint, verify=False, stream=True)
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure(TransientException(str(e)))
+            raise
+        self.last_response = response
+        if response.status_code != 200:
+            # Error bodies are small, decode them the usual way
+            self._raise_for_error(response)
+            return
+        if breaker is not None:
+            breaker.record_success()
+
+        stream = JSONArrayStream(response.iter_content(chunk_size=65536), key)
+        yield from stream
+        self.last_json = stream.envelope
+
+    def _get_total(self, key: str, more: str, fetch, username_id, *args) -> List[Dict[str, Any]]:
+        """
+        `key` list of every page returned by `fetch(username_id, max_id, *args)`,
+        following `next_max_id` while the `more` flag is set
 
-    def get_total_followings(self, username_id):
-        followers = []
+        Raises RequestFailedException when a page fails with an error of no
+        known kind, instead of reading the previous page again.
+        """
+        elements = []
         next_max_id = ''
         while True:
-            self.get_user_followings(username_id, next_max_id)
-            temp = self.last_json
+            if not fetch(username_id, next_max_id, *args):
+                status_code = self.last_response.status_code if self.last_response is not None else None
+                raise RequestFailedException(f'Page request for {username_id} failed at max_id {next_max_id!r}', status_code, self.last_json)
+            page = self.last_json
+            elements.extend(page.get(key, []))
+            next_max_id = page.get('next_max_id')
+            if not page.get(more) or not next_max_id:
+                return elements
 
-            for item in temp["users"]:
-                followers.append(item)
+    def get_total_followers(self, username_id):
+        return self._get_total('users', 'big_list', self.get_user_followers, username_id)
 
-            if temp["big_list"] is False:
-                return followers
-            next_max_id = temp["next_max_id"]
+    def get_total_followings(self, username_id):
+        return self._get_total('users', 'big_list', self.get_user_followings, username_id)
 
     def get_total_user_feed(self, username_id, min_timestamp=None):
-        user_feed = []
-        next_max_id = ''
-        while True:
-            self.get_user_feed(username_id, next_max_id, min_timestamp)
-            temp = self.last_json
-            for item in temp["items"]:
-                user_feed.append(item)
-            if temp["more_available"] is False:
-                return user_feed
-            next_max_id = temp["next_max_id"]
+        return self._get_total('items', 'more_available', self.get_user_feed, username_id, min_timestamp)
 
     def get_total_self_user_feed(self, min_timestamp=None):
         return self.get_total_user_feed(self.username_id, min_timestamp)
@@ -1308,12 +1920,11 @@ class InstagramAPI:
         next_id = ''
         liked_items = []
         for _ in range(0, scan_rate):
-            temp = self.get_liked_media(next_id)
-            temp = self.last_json
-            try:
-                next_id = temp["next_max_id"]
-                for item in temp["items"]:
-                    liked_items.append(item)
-            except KeyError:
+            if not self.get_liked_media(next_id):
+                break
+            page = self.last_json
+            liked_items.extend(page.get('items', []))
+            next_id = page.get('next_max_id')
+            if not next_id:
                 break
         return liked_items
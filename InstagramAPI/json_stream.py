@@ -0,0 +1,165 @@
+"""
+Utility functions for decoding JSON responses
+
+Whole responses are decoded straight from bytes, skipping the intermediate
+`str`, and use orjson when it is installed. Large list pages (`users`,
+`items`) can be decoded incrementally from the raw byte stream with
+`JSONArrayStream`.
+"""
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = ["loads", "JSONArrayStream"]
+
+
+def loads(data) -> Any:
+    """
+    Decode a JSON document from `bytes`, `bytearray` or `str`
+
+    Uses orjson when available and falls back to the standard library.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+
+class JSONArrayStream:
+    """
+    Incrementally decode one top-level list of a JSON object
+
+    Iterating yields the elements of `key` as soon as each one has been
+    received, so a page never has to be held in memory as a whole. Once
+    iteration is finished, `envelope` holds the rest of the document
+    (`next_max_id`, `big_list`, ...) with `key` set to an empty list.
+
+    Each chunk is decoded to text as it arrives and elements are parsed with
+    the C accelerated scanner of the standard library.
+
+    Args:
+        chunks: Iterable[bytes] Raw response body, e.g. `response.iter_content()`
+        key: str Name of the top-level list to stream
+    """
+
+    def __init__(self, chunks: Iterable[bytes], key: str) -> None:
+        self.chunks = chunks
+        self.key = key
+        self.envelope: Optional[dict] = None
+        self.count = 0
+
+        self._chunks = None
+        self._decoder = None
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self) -> Iterator[Any]:
+        self._chunks = iter(self.chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+        if self._next_char() != '{':
+            raise ValueError("Expected a JSON object")
+
+        envelope = {}
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            while True:
+                key = self._value()
+                if not isinstance(key, str) or self._next_char() != ':':
+                    raise ValueError(f"Invalid object key at char {self._pos}")
+                if key == self.key and self._peek() == '[':
+                    self._pos += 1
+                    envelope[key] = []
+                    yield from self._items()
+                else:
+                    envelope[key] = self._value()
+                char = self._next_char()
+                if char == '}':
+                    break
+                if char != ',':
+                    raise ValueError(f"Expected ',' or '}}' at char {self._pos}")
+        self.envelope = envelope
+
+    def _items(self) -> Iterator[Any]:
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            item = self._value()
+            self.count += 1
+            yield item
+            char = self._next_char()
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' at char {self._pos}")
+
+    def _fill(self) -> bool:
+        """
+        Append the next chunk to the buffer, dropping consumed text
+
+        Returns False once the stream is exhausted
+        """
+        if self._eof:
+            return False
+        text = ''
+        while not text:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                text = self._decoder.decode(b'', final=True)
+                break
+            text = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return bool(text)
+
+    def _peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it
+        """
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON response")
+
+    def _next_char(self) -> str:
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def _value(self) -> Any:
+        """
+        Decode the next value, reading more chunks until it is complete
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            if ((end == len(self._buf) or self._buf[end] in _NUMBER_CHARS)
+                    and self._fill()):
+                # A number may continue in the next chunk
+                continue
+            self._pos = end
+            return value
@@ -0,0 +1,245 @@
+"""
+Typed views over decoded API responses
+
+The models wrap the dict decoded from a response instead of copying it:
+scalar fields are read from the dict on access, and nested objects (the user
+of a media, its caption and comments, the items of a page) are only wrapped
+in their model the first time they are accessed, then kept in a slot.
+Reading three fields of every item of a page therefore allocates nothing but
+the wrappers of the objects actually visited.
+
+Decoding is unchanged: the payload is the fully decoded `last_json`, so the
+models add allocations and time on top of plain dict access rather than
+saving any (see examples/evaluation/benchmark_models.py). They are for
+callers who want typed access; the client itself reads `last_json` and only
+builds them for `last_page`.
+
+Every model keeps the payload in `data`, and `model['key']` still reads it
+directly for fields without a property.
+"""
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from .friendships import Friendship
+
+__all__ = ["Model", "User", "Comment", "Media", "Thread", "Page"]
+
+_MISSING = object()
+
+
+class _Field:
+    """
+    Read `key` from the wrapped payload
+    """
+    __slots__ = ('key', 'default')
+
+    def __init__(self, key: str, default: Any = None) -> None:
+        self.key = key
+        self.default = default
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.data.get(self.key, self.default)
+
+
+class _Nested:
+    """
+    Wrap `key` of the payload with `convert` on first access and keep the
+    result in the slot named after the attribute with a leading underscore
+
+    With `many` the value is a list and every element is converted, giving
+    a tuple. Missing or null values give None (or an empty tuple).
+    """
+    __slots__ = ('key', 'convert', 'many', 'slot')
+
+    def __init__(self, key: str, convert: Callable[[Any], Any], many: bool = False) -> None:
+        self.key = key
+        self.convert = convert
+        self.many = many
+        self.slot = None
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.slot = owner.__dict__[f'_{name}']
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if value is _MISSING:
+            raw = instance.data.get(self.key)
+            if self.many:
+                value = tuple(self.convert(element) for element in raw or ())
+            else:
+                value = self.convert(raw) if raw is not None else None
+            self.slot.__set__(instance, value)
+        return value
+
+
+class Model:
+    """
+    Base of the response models
+
+    Args:
+        data: Dict[str, Any] Decoded payload of the object
+    """
+    __slots__ = ('data',)
+    _nested: Tuple[str, ...] = ()
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = data
+        for slot in self._nested:
+            setattr(self, slot, _MISSING)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other.data == self.data
+
+    def __repr__(self) -> str:
+        key = 'username' if 'username' in self.data else 'pk'
+        return f'{type(self).__name__}({key}={self.data.get(key)!r})'
+
+
+class User(Model):
+    _nested = __slots__ = ('_friendship',)
+
+    pk = _Field('pk')
+    username = _Field('username')
+    full_name = _Field('full_name', '')
+    is_private = _Field('is_private', False)
+    is_verified = _Field('is_verified', False)
+    profile_pic_url = _Field('profile_pic_url')
+    biography = _Field('biography', '')
+    follower_count = _Field('follower_count')
+    following_count = _Field('following_count')
+    media_count = _Field('media_count')
+    latest_reel_media = _Field('latest_reel_media')
+    friendship = _Nested('friendship_status', Friendship.from_json)
+
+
+class Comment(Model):
+    _nested = __slots__ = ('_user',)
+
+    pk = _Field('pk')
+    text = _Field('text', '')
+    created_at = _Field('created_at')
+    user_id = _Field('user_id')
+    media_id = _Field('media_id')
+    comment_like_count = _Field('comment_like_count', 0)
+    user = _Nested('user', User)
+
+
+class Media(Model):
+    _nested = __slots__ = ('_user', '_caption', '_comments', '_carousel_media')
+
+    pk = _Field('pk')
+    id = _Field('id')
+    code = _Field('code')
+    taken_at = _Field('taken_at')
+    media_type = _Field('media_type')
+    like_count = _Field('like_count', 0)
+    comment_count = _Field('comment_count', 0)
+    has_liked = _Field('has_liked', False)
+    location = _Field('location')
+    user = _Nested('user', User)
+    caption = _Nested('caption', Comment)
+    comments = _Nested('comments', Comment, many=True)
+    carousel_media = _Nested('carousel_media', lambda data: Media(data), many=True)
+
+    @property
+    def caption_text(self) -> str:
+        caption = self.data.get('caption')
+        return caption.get('text', '') if caption else ''
+
+
+class Thread(Model):
+    _nested = __slots__ = ('_users', '_inviter')
+
+    thread_id = _Field('thread_id')
+    thread_title = _Field('thread_title', '')
+    last_activity_at = _Field('last_activity_at')
+    has_older = _Field('has_older', False)
+    oldest_cursor = _Field('oldest_cursor')
+    items = _Field('items', ())
+    users = _Nested('users', User, many=True)
+    inviter = _Nested('inviter', User)
+
+
+# Top-level list of a page and the model of its elements, in lookup order
+_PAGE_LISTS = (
+    ('users', User),
+    ('items', Media),
+    ('ranked_items', Media),
+    ('comments', Comment),
+)
+
+
+class Page(Model):
+    """
+    One page of a paginated response (followers, feeds, comments, inbox)
+
+    Iterating wraps the elements one at a time without keeping them; the
+    `users`, `items`, `comments` and `threads` properties build and keep the
+    whole tuple.
+
+    Example:
+        api.get_user_followers(user_id)
+        page = api.last_page
+        for user in page:
+            print(user.pk, user.username)
+        page.next_max_id
+    """
+    _nested = __slots__ = ('_users', '_items', '_ranked_items', '_comments', '_threads')
+
+    status = _Field('status')
+    next_max_id = _Field('next_max_id')
+    users = _Nested('users', User, many=True)
+    items = _Nested('items', Media, many=True)
+    ranked_items = _Nested('ranked_items', Media, many=True)
+    comments = _Nested('comments', Comment, many=True)
+
+    @property
+    def threads(self) -> Tuple[Thread, ...]:
+        if self._threads is _MISSING:
+            inbox = self.data.get('inbox') or {}
+            self._threads = tuple(Thread(thread) for thread in inbox.get('threads', ()))
+        return self._threads
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """
+        Cursor of the next page, None on the last one
+        """
+        inbox = self.data.get('inbox')
+        if inbox is not None:
+            return inbox.get('oldest_cursor') if inbox.get('has_older') else None
+        if not self.has_more:
+            return None
+        return self.data.get('next_max_id')
+
+    @property
+    def has_more(self) -> bool:
+        data = self.data
+        return bool(data.get('big_list') or data.get('more_available') or data.get('has_more_comments') or data.get('has_more'))
+
+    def _list(self):
+        for key, model in _PAGE_LISTS:
+            elements = self.data.get(key)
+            if elements is not None:
+                return elements, model
+        inbox = self.data.get('inbox')
+        if inbox is not None:
+            return inbox.get('threads', ()), Thread
+        return (), Model
+
+    def __iter__(self) -> Iterator[Model]:
+        elements, model = self._list()
+        for element in elements:
+            yield model(element)
+
+    def __len__(self) -> int:
+        return len(self._list()[0])
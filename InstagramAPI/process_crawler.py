@@ -0,0 +1,377 @@
+"""
+Multi-process sharded crawling of followers/followings
+
+Every worker process restores its own `InstagramAPI` session from a file
+written by `InstagramAPI.save_session` and crawls shards of targets. Pages are
+appended to the worker's own segment of a `ResultStore` on disk instead of
+being pickled back to the parent, which only receives small progress events.
+"""
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .crawler import PAGE_METHODS, iter_relation_pages
+from .json_stream import loads
+
+__all__ = ["ProcessCrawler", "ResultStore"]
+
+
+class StoreSegment:
+    """
+    Append-only segment of a `ResultStore` owned by a single process
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write_page(self, target_id, page: int, users: List[Dict[str, Any]]) -> None:
+        self._file.write(json.dumps({'target': target_id, 'page': page, 'users': users}) + '\n')
+
+    def mark_done(self, target_id, records: int) -> None:
+        self._file.write(json.dumps({'done': True, 'target': target_id, 'records': records}) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ResultStore:
+    """
+    Append-only crawl result store shared by several processes
+
+    Every process appends to its own segment file, so writers never contend
+    and no locking is needed. A segment holds two kinds of lines:
+
+        {"target": <id>, "page": <n>, "users": [...]}
+        {"done": true, "target": <id>, "records": <n>}
+
+    Pages only count once their target has a done marker in the same segment,
+    so whatever a crashed worker wrote for its unfinished target is ignored.
+
+    Args:
+        directory: str Directory holding the segment files
+    """
+    SEGMENT_PREFIX = 'segment-'
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def open_segment(self, name: str) -> StoreSegment:
+        return StoreSegment(os.path.join(self.directory, f'{self.SEGMENT_PREFIX}{name}.jsonl'))
+
+    def segments(self) -> List[str]:
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(self.SEGMENT_PREFIX)
+        )
+
+    @staticmethod
+    def _done_targets(path: str) -> set:
+        done = set()
+        with open(path, 'r', encoding='utf-8') as segment:
+            for line in segment:
+                if line.startswith('{"done"') and line.endswith('\n'):
+                    done.add(str(loads(line)['target']))
+        return done
+
+    def completed_targets(self) -> set:
+        """
+        Ids (as str) of every target crawled to completion
+        """
+        done = set()
+        for path in self.segments():
+            done |= self._done_targets(path)
+        return done
+
+    def iter_users(self) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        Yield (target_id, user) for every completed target
+
+        A target completed by more than one worker is only yielded once.
+        """
+        emitted = set()
+        for path in self.segments():
+            done = self._done_targets(path) - emitted
+            emitted |= done
+            with open(path, 'r', encoding='utf-8') as segment:
+                for line in segment:
+                    if not line.startswith('{"target"') or not line.endswith('\n'):
+                        continue
+                    page = loads(line)
+                    if str(page['target']) in done:
+                        for user in page['users']:
+                            yield page['target'], user
+
+
+def restore_session(path: str):
+    """
+    Default client factory, restores a client saved with `save_session`
+    """
+    # Imported here so the parent process does not need a session at all
+    from .instagram_api import InstagramAPI
+    return InstagramAPI.from_session(path)
+
+
+def _worker_main(index, session, store_dir, relation, max_pages, client_factory, tasks, events):
+    client = client_factory(session)
+    segment = ResultStore(store_dir).open_segment(f'{index}-{os.getpid()}')
+    events.put(('ready', index, os.getpid()))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        shard_id, targets = task
+        for target_id in targets:
+            records = 0
+            try:
+                pages = iter_relation_pages(client, target_id, relation, max_pages)
+                for page, users in enumerate(pages):
+                    segment.write_page(target_id, page, users)
+                    records += len(users)
+            except Exception as e:
+                events.put(('failed', index, shard_id, target_id, str(e)))
+                continue
+            segment.mark_done(target_id, records)
+            events.put(('done', index, shard_id, target_id, records))
+        events.put(('ready', index, os.getpid()))
+    segment.close()
+
+
+class _Worker:
+    def __init__(self, index: int, session) -> None:
+        self.index = index
+        self.session = session
+        self.process = None
+        self.tasks = None
+        self.pid = None
+        self.shard_id = None
+        self.ready = False
+        self.stopped = False
+        self.restarts = 0
+        self.targets = 0
+        self.records = 0
+        self.errors = 0
+        self.started = None
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started if self.started else 0.0
+        return {
+            'worker': self.index,
+            'pid': self.pid,
+            'targets': self.targets,
+            'records': self.records,
+            'errors': self.errors,
+            'restarts': self.restarts,
+            'records_per_sec': self.records / elapsed if elapsed else 0.0,
+            'targets_per_sec': self.targets / elapsed if elapsed else 0.0,
+        }
+
+
+class ProcessCrawler:
+    """
+    Crawl followers (or followings) of many targets with a pool of processes
+
+    One worker process is started per session file. Targets are deduplicated,
+    targets already completed in the store are skipped, and the rest are cut
+    into shards handed out to idle workers. When a worker process dies, the
+    unfinished part of its shard is re-queued and the worker is restarted.
+
+    Args:
+        sessions: List[str] Session files written by `InstagramAPI.save_session`
+        store_dir: str Directory of the `ResultStore`
+        relation: str 'followers' or 'followings'
+        shard_size: int Targets per shard
+        max_pages: int Stop after this many pages per target (None for all)
+        client_factory: Callable[[session], InstagramAPI] run in each worker,
+                        must be picklable. Defaults to `restore_session`
+        max_restarts: int Restarts allowed per worker before giving up on it
+
+    Example:
+        crawler = ProcessCrawler(['a.session', 'b.session'], 'crawl_store')
+        crawler.run(user_ids)
+        for target_id, user in crawler.store.iter_users():
+            ...
+    """
+
+    def __init__(
+            self,
+            sessions: List[Any],
+            store_dir: str,
+            relation: str = 'followers',
+            shard_size: int = 100,
+            max_pages: Optional[int] = None,
+            client_factory: Callable = restore_session,
+            max_restarts: int = 3
+        ) -> None:
+        if not sessions:
+            raise ValueError('ProcessCrawler needs at least one session')
+        if relation not in PAGE_METHODS:
+            raise ValueError(f'relation must be one of {list(PAGE_METHODS)}')
+
+        self.sessions = sessions
+        self.store = ResultStore(store_dir)
+        self.relation = relation
+        self.shard_size = shard_size
+        self.max_pages = max_pages
+        self.client_factory = client_factory
+        self.max_restarts = max_restarts
+
+        self.workers: List[_Worker] = []
+        self.pending: Dict[int, List[Any]] = {}
+        self.targets_total = 0
+        self.targets_done = 0
+        self.skipped = 0
+        self.records = 0
+        self.errors = 0
+        self.started = None
+        self._shards = collections.deque()
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        Aggregate progress and per worker throughput
+        """
+        elapsed = time.time() - self.started if self.started else 0.0
+        return {
+            'targets_total': self.targets_total,
+            'targets_done': self.targets_done,
+            'skipped': self.skipped,
+            'records': self.records,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'records_per_sec': self.records / elapsed if elapsed else 0.0,
+            'workers': [worker.stats() for worker in self.workers],
+        }
+
+    def run(self, targets: Iterable, report_interval: float = 30.0) -> Dict[str, Any]:
+        """
+        Crawl every unique target not already in the store
+
+        Blocks until all shards are finished and returns `progress()`
+        """
+        completed = self.store.completed_targets()
+        unique = []
+        seen = set()
+        for target_id in targets:
+            key = str(target_id)
+            if key in completed:
+                self.skipped += 1
+            elif key not in seen:
+                seen.add(key)
+                unique.append(target_id)
+
+        shards = self._shards = collections.deque()
+        for shard_id, start in enumerate(range(0, len(unique), self.shard_size)):
+            self.pending[shard_id] = unique[start:start + self.shard_size]
+            shards.append(shard_id)
+        self.targets_total = len(unique)
+        self.started = time.time()
+
+        context = multiprocessing.get_context()
+        events = context.Queue()
+        self.workers = [_Worker(index, session) for index, session in enumerate(self.sessions)]
+        for worker in self.workers:
+            self._start(context, worker, events)
+
+        last_report = time.time()
+        while shards or any(worker.shard_id is not None for worker in self.workers):
+            try:
+                event = events.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            else:
+                self._handle(event)
+
+            self._check_workers(context, events, shards)
+            for worker in self.workers:
+                if worker.ready and worker.shard_id is None and shards:
+                    shard_id = shards.popleft()
+                    worker.shard_id = shard_id
+                    worker.tasks.put((shard_id, list(self.pending[shard_id])))
+
+            if time.time() - last_report > report_interval:
+                last_report = time.time()
+                logging.info(f"Process crawl progress: {self.progress()}")
+
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join()
+        logging.info(f"Process crawl finished: {self.progress()}")
+        return self.progress()
+
+    def _start(self, context, worker: _Worker, events) -> None:
+        worker.tasks = context.Queue()
+        worker.ready = False
+        worker.shard_id = None
+        worker.started = worker.started or time.time()
+        worker.process = context.Process(
+            target=_worker_main,
+            args=(
+                worker.index, worker.session, self.store.directory, self.relation,
+                self.max_pages, self.client_factory, worker.tasks, events
+            ),
+            daemon=True
+        )
+        worker.process.start()
+
+    def _finish_target(self, shard_id: int, target_id) -> bool:
+        remaining = self.pending.get(shard_id, [])
+        if target_id not in remaining:
+            # Already reported by a worker that died afterwards
+            return False
+        remaining.remove(target_id)
+        self.targets_done += 1
+        return True
+
+    def _handle(self, event: Tuple) -> None:
+        kind, index = event[0], event[1]
+        worker = self.workers[index]
+        if kind == 'ready':
+            worker.pid = event[2]
+            worker.ready = True
+            if worker.shard_id is not None and self.pending[worker.shard_id]:
+                # Events for the rest of the shard never arrived
+                self._shards.appendleft(worker.shard_id)
+            worker.shard_id = None
+        elif kind == 'done':
+            _, _, shard_id, target_id, records = event
+            if self._finish_target(shard_id, target_id):
+                worker.targets += 1
+                worker.records += records
+                self.records += records
+        elif kind == 'failed':
+            _, _, shard_id, target_id, error = event
+            if self._finish_target(shard_id, target_id):
+                worker.errors += 1
+                self.errors += 1
+                logging.warning(f"Crawl of {target_id} failed in worker {index}: {error}")
+
+    def _check_workers(self, context, events, shards: collections.deque) -> None:
+        for worker in self.workers:
+            if worker.stopped or worker.process is None or worker.process.is_alive():
+                continue
+            logging.warning(
+                f"Crawl worker {worker.index} exited with code {worker.process.exitcode}"
+            )
+            if worker.shard_id is not None and self.pending[worker.shard_id]:
+                shards.appendleft(worker.shard_id)
+            worker.shard_id = None
+            worker.ready = False
+
+            if worker.restarts >= self.max_restarts:
+                worker.stopped = True
+                if all(other.stopped for other in self.workers):
+                    raise RuntimeError('Every crawl worker failed, giving up')
+                continue
+            worker.restarts += 1
+            self._start(context, worker, events)
@@ -0,0 +1,251 @@
+"""
+Pool of proxies with health checks and latency aware selection
+
+Every request reports its latency and outcome back to the pool, which keeps
+an exponentially weighted moving average (EWMA) of both per proxy. Proxies
+that keep failing are evicted and only re-admitted after a successful health
+probe. Accounts stick to one proxy until it fails or is evicted.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+__all__ = ["ProxyPool", "ProxyStats", "proxy_ok"]
+
+
+def proxy_ok(status_code: int) -> bool:
+    """
+    Whether a response status speaks for the proxy it came through
+
+    Server errors and 429 (rate limits are applied per IP) count against it.
+    """
+    return status_code < 500 and status_code != 429
+
+
+class ProxyStats:
+    """
+    Health of a single proxy
+
+    Latency and error rate are EWMAs updated by every reported request.
+    """
+
+    def __init__(self, proxy: str) -> None:
+        self.proxy = proxy
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.evicted = False
+        self.evicted_at = 0.0
+
+    def score(self, default_latency: float) -> float:
+        """
+        Lower is better: expected latency, inflated by the error rate
+        """
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + 4 * self.error_rate)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'proxy': self.proxy,
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+            'failures': self.failures,
+            'evicted': self.evicted,
+        }
+
+
+class ProxyPool:
+    """
+    Pick a healthy proxy for each request and keep track of how proxies do
+
+    Args:
+        proxies: Iterable[str] Proxy urls, e.g. 'http://user:password@ip:port'
+        alpha: float Weight of the newest sample in the EWMAs
+        max_error_rate: float Evict a proxy once its error EWMA exceeds this
+        max_consecutive_failures: int Evict a proxy after this many failures in a row
+        readmit_after: float Seconds an evicted proxy waits before being probed
+        probe_url: str Url fetched through each proxy by `probe`
+        probe_timeout: float Timeout of a health probe
+        request_timeout: float Timeout of requests sent through the pool
+        slow_factor: float Move an account off its proxy once that proxy is
+                     this many times slower than the fastest healthy one
+
+    Example:
+        pool = ProxyPool(['http://10.0.0.1:3128', 'http://10.0.0.2:3128'])
+        pool.start_health_checks(interval=60)
+        api.set_proxy_pool(pool)
+    """
+
+    def __init__(
+            self,
+            proxies: Iterable[str],
+            alpha: float = 0.2,
+            max_error_rate: float = 0.5,
+            max_consecutive_failures: int = 3,
+            readmit_after: float = 60.0,
+            probe_url: str = 'https://i.instagram.com/',
+            probe_timeout: float = 10.0,
+            request_timeout: float = 30.0,
+            slow_factor: float = 3.0
+        ) -> None:
+        self.stats: Dict[str, ProxyStats] = {proxy: ProxyStats(proxy) for proxy in proxies}
+        if not self.stats:
+            raise ValueError('ProxyPool needs at least one proxy')
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.readmit_after = readmit_after
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self.request_timeout = request_timeout
+        self.slow_factor = slow_factor
+
+        self._sticky: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker = None
+
+    def healthy(self) -> List[str]:
+        return [proxy for proxy, stats in self.stats.items() if not stats.evicted]
+
+    def select(self, account: str = '', exclude: Optional[str] = None) -> str:
+        """
+        Proxy for the next request of `account`
+
+        Keeps returning the same proxy for an account while it is healthy and
+        not `slow_factor` times slower than the fastest one. Otherwise the
+        better of two random healthy proxies is picked, which favours fast
+        proxies without sending every account to the same one.
+        When every proxy is evicted, the one evicted longest ago is used.
+
+        Args:
+            account: str Account the proxy is kept for
+            exclude: str Pick any healthy proxy but this one, without changing
+                     the account's proxy (used for hedged requests)
+        """
+        with self._lock:
+            healthy = [stats for stats in self.stats.values() if not stats.evicted]
+            known = [stats.latency for stats in healthy if stats.latency is not None]
+
+            others = [stats for stats in healthy if stats.proxy != exclude]
+            if exclude is not None and others:
+                default_latency = sum(known) / len(known) if known else 1.0
+                candidates = random.sample(others, min(2, len(others)))
+                return min(candidates, key=lambda stats: stats.score(default_latency)).proxy
+
+            proxy = self._sticky.get(account)
+            if proxy is not None and not self.stats[proxy].evicted:
+                latency = self.stats[proxy].latency
+                if latency is None or not known or latency <= self.slow_factor * min(known):
+                    return proxy
+
+            if not healthy:
+                choice = min(self.stats.values(), key=lambda stats: stats.evicted_at)
+            else:
+                default_latency = sum(known) / len(known) if known else 1.0
+                candidates = random.sample(healthy, min(2, len(healthy)))
+                choice = min(candidates, key=lambda stats: stats.score(default_latency))
+            self._sticky[account] = choice.proxy
+            return choice.proxy
+
+    def report(self, proxy: str, latency: float, ok: bool) -> None:
+        """
+        Record the outcome of a request sent through `proxy`
+        """
+        with self._lock:
+            stats = self.stats.get(proxy)
+            if stats is None:
+                return
+            stats.requests += 1
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok:
+                stats.consecutive_failures = 0
+                if stats.latency is None:
+                    stats.latency = latency
+                else:
+                    stats.latency += self.alpha * (latency - stats.latency)
+                return
+
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if not stats.evicted and (
+                    stats.error_rate > self.max_error_rate
+                    or stats.consecutive_failures >= self.max_consecutive_failures):
+                stats.evicted = True
+                stats.evicted_at = time.monotonic()
+                logging.warning(f"Evicted proxy {proxy}: {stats.as_dict()}")
+                # Move every account using it elsewhere on their next request
+                for account, sticky in list(self._sticky.items()):
+                    if sticky == proxy:
+                        del self._sticky[account]
+
+    def readmit(self, proxy: str) -> None:
+        with self._lock:
+            stats = self.stats[proxy]
+            stats.evicted = False
+            stats.error_rate = 0.0
+            stats.consecutive_failures = 0
+            logging.info(f"Re-admitted proxy {proxy}")
+
+    def retry_delay(self) -> float:
+        """
+        Seconds to wait before retrying a failed request
+        """
+        return 0.0 if self.healthy() else min(self.readmit_after, 5.0)
+
+    def probe(self, session=None) -> None:
+        """
+        Health check every proxy once
+
+        Healthy proxies get a latency sample, evicted ones are re-admitted
+        once `readmit_after` has passed and the probe succeeds.
+        """
+        session = session or requests.Session()
+        for proxy, stats in list(self.stats.items()):
+            if stats.evicted and time.monotonic() - stats.evicted_at < self.readmit_after:
+                continue
+            started = time.monotonic()
+            try:
+                response = session.get(
+                    self.probe_url,
+                    proxies={'http': proxy, 'https': proxy},
+                    timeout=self.probe_timeout,
+                    verify=False
+                )
+                ok = proxy_ok(response.status_code)
+            except Exception:
+                ok = False
+            latency = time.monotonic() - started
+            if stats.evicted:
+                if ok:
+                    self.readmit(proxy)
+                    self.report(proxy, latency, ok)
+                else:
+                    stats.evicted_at = time.monotonic()
+            else:
+                self.report(proxy, latency, ok)
+
+    def start_health_checks(self, interval: float = 60.0) -> None:
+        """
+        Probe all proxies every `interval` seconds in a daemon thread
+        """
+        if self._checker is not None and self._checker.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.probe()
+
+        self._checker = threading.Thread(target=run, daemon=True)
+        self._checker.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,72 @@
+"""
+Client side rate limiting
+"""
+import threading
+import time
+
+__all__ = ["RateLimiter"]
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket
+
+    Args:
+        rate: float Tokens added per second
+        burst: int Most tokens that can be saved up
+
+    Example:
+        # At most one upload every 15 minutes
+        limiter = RateLimiter(rate=1 / 900)
+        limiter.acquire()
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Take `tokens` if they are available right now
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def time_until(self, tokens: float = 1) -> float:
+        """
+        Seconds until `tokens` are available, 0 if they are now
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Block until `tokens` are available and take them
+
+        Returns the number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,194 @@
+"""
+Response cache for idempotent read endpoints
+
+Responses are kept in a memory bounded LRU with a time to live per endpoint
+template, optionally backed by a sqlite file that several processes can share.
+Writes on a media or user invalidate the cached reads about it.
+"""
+import collections
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+__all__ = ["ResponseCache"]
+
+# Endpoint templates that may be cached, with their default TTL in seconds
+DEFAULT_TTLS = {
+    'users/{}/info/': 300.0,
+    'users/{}/usernameinfo/': 300.0,
+    'friendships/show/{}/': 60.0,
+    'media/{}/info/': 120.0,
+    'tags/search/': 600.0,
+    'fbsearch/places/': 600.0,
+}
+
+MEDIA_TEMPLATES = ('media/{}/info/',)
+USER_TEMPLATES = ('users/{}/info/', 'friendships/show/{}/')
+
+# Write endpoints, and the id whose cached reads they make stale
+MEDIA_WRITE = re.compile(r'media/([^/]+)/(?:like|unlike|save|unsave|comment|edit_media|delete|remove)/')
+USER_WRITE = re.compile(r'friendships/(?:create|destroy|block|unblock|approve|ignore)/([^/]+)/')
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of raw response bodies
+
+    Bodies are stored as bytes, so every hit is decoded into a fresh object
+    that callers are free to mutate. Entries are scoped per account, since
+    friendship and media info depend on who is asking.
+
+    Args:
+        max_bytes: int Memory budget of the in-process LRU
+        ttls: Dict[str, float] TTL per endpoint template, merged over DEFAULT_TTLS
+        disk_path: str Optional sqlite file used as a second tier, shared
+                   between processes
+
+    Example:
+        api.set_response_cache(ResponseCache(disk_path='responses.db'))
+        api.get_username_info(user_id)  # network
+        api.get_username_info(user_id)  # cache
+        print(api.metrics()['response_cache'])
+    """
+
+    def __init__(
+            self,
+            max_bytes: int = 32 * 1024 * 1024,
+            ttls: Optional[Dict[str, float]] = None,
+            disk_path: Optional[str] = None
+        ) -> None:
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._entries: 'collections.OrderedDict[str, Tuple[float, bytes]]' = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.db = None
+        if disk_path is not None:
+            self.db = sqlite3.connect(disk_path, timeout=30, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, expires REAL, body BLOB)'
+            )
+            # Expired rows are only skipped on read, clear them out on open
+            self.db.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),))
+            self.db.commit()
+
+    @staticmethod
+    def key(template: str, param, scope: str = '') -> str:
+        return f'{scope}|{template}|{param}'
+
+    def get(self, template: str, param, scope: str = '') -> Optional[bytes]:
+        """
+        Cached body for `template` and `param`, None on a miss
+        """
+        key = self.key(template, param, scope)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+
+            if self.db is not None:
+                row = self.db.execute(
+                    'SELECT expires, body FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    self._store(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, template: str, param, body: bytes, scope: str = '') -> None:
+        if template not in self.ttls:
+            return
+        key = self.key(template, param, scope)
+        expires = time.time() + self.ttls[template]
+        with self._lock:
+            self._store(key, expires, body)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO responses (key, expires, body) VALUES (?, ?, ?)',
+                    (key, expires, body)
+                )
+                self.db.commit()
+
+    def invalidate(self, template: str, param, scope: str = '') -> None:
+        key = self.key(template, param, scope)
+        with self._lock:
+            self.invalidations += 1
+            if key in self._entries:
+                self._remove(key)
+            if self.db is not None:
+                self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.db.commit()
+
+    def invalidate_media(self, media_id, scope: str = '') -> None:
+        """
+        Drop cached reads about a media, after writing to it
+        """
+        for template in MEDIA_TEMPLATES:
+            self.invalidate(template, media_id, scope)
+
+    def invalidate_user(self, user_id, scope: str = '') -> None:
+        """
+        Drop cached reads about a user, after following, blocking etc.
+        """
+        for template in USER_TEMPLATES:
+            self.invalidate(template, user_id, scope)
+
+    def invalidate_write(self, endpoint: str, scope: str = '') -> None:
+        """
+        Drop whatever a request to the write `endpoint` makes stale
+        """
+        match = MEDIA_WRITE.match(endpoint)
+        if match is not None:
+            self.invalidate_media(match.group(1), scope)
+            return
+        match = USER_WRITE.match(endpoint)
+        if match is not None:
+            self.invalidate_user(match.group(1), scope)
+
+    def _store(self, key: str, expires: float, body: bytes) -> None:
+        if key in self._entries:
+            self._remove(key)
+        if len(body) > self.max_bytes:
+            return
+        self._entries[key] = (expires, body)
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,180 @@
+"""
+Priority request scheduler for a single account
+
+Every request of a client takes a slot from the scheduler before it is sent.
+Slots are handed out at the account's rate budget: to the highest priority
+class with waiting requests first and, within a class, fairly between
+callers in proportion to their weights (start-time fair queuing). Interactive
+calls therefore skip ahead of queued crawl pages, while background work uses
+whatever budget is left.
+"""
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+from .rate_limit import RateLimiter
+
+__all__ = ["RequestScheduler", "PRIORITIES"]
+
+# Priority classes, most urgent first
+PRIORITIES = ('interactive', 'normal', 'background')
+
+# Dispatches of a class between two prunes of its finish tags
+PRUNE_EVERY = 64
+
+
+class _Request:
+    __slots__ = ('key', 'priority', 'caller', 'start', 'cost', 'queued_at')
+
+    def __init__(self, key, priority: str, caller: Hashable, start: float, cost: float) -> None:
+        self.key = key
+        self.priority = priority
+        self.caller = caller
+        self.start = start
+        self.cost = cost
+        self.queued_at = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    Hand out request slots by priority class and weighted fair share
+
+    Args:
+        limiter: RateLimiter The account's request budget, slots are only
+                 limited by priority order when None
+
+    Example:
+        scheduler = RequestScheduler(RateLimiter(rate=1, burst=5))
+        api.set_scheduler(scheduler)
+
+        # crawler threads
+        with scheduler.priority('background', caller='crawl', weight=1):
+            api.get_total_followers(user_id)
+
+        # dashboard
+        with scheduler.priority('interactive', caller='dashboard'):
+            api.like(media_id)
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None) -> None:
+        self.limiter = limiter
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual = {priority: 0.0 for priority in PRIORITIES}
+        self._finish: Dict[tuple, float] = {}
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._local = threading.local()
+
+        self.dispatched = {priority: 0 for priority in PRIORITIES}
+        self.waited = {priority: 0.0 for priority in PRIORITIES}
+        self.max_wait = {priority: 0.0 for priority in PRIORITIES}
+
+    @contextlib.contextmanager
+    def priority(self, priority: str, caller: Optional[Hashable] = None, weight: float = 1.0):
+        """
+        Send the requests of this thread with `priority` as `caller` inside the block
+
+        Args:
+            priority: str One of PRIORITIES
+            caller: Hashable Fair share key within the class, the thread name
+                    when None
+            weight: float Share of the class budget relative to other callers
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority {priority!r}, expected one of {PRIORITIES}')
+        previous = getattr(self._local, 'context', None)
+        self._local.context = (priority, caller, weight)
+        try:
+            yield self
+        finally:
+            self._local.context = previous
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """
+        Block until the calling thread may send a request
+
+        Returns the seconds spent waiting
+        """
+        priority, caller, weight = getattr(self._local, 'context', None) or ('normal', None, 1.0)
+        if caller is None:
+            caller = threading.current_thread().name
+
+        with self._cond:
+            # Start tag: the class' virtual time, or where this caller's
+            # previous request finished if that is later
+            start = max(self._virtual[priority], self._finish.get((priority, caller), 0.0))
+            self._finish[(priority, caller)] = start + cost / weight
+            request = _Request((PRIORITIES.index(priority), start, next(self._seq)), priority, caller, start, cost)
+            heapq.heappush(self._queue, (request.key, request))
+            self._queued[priority] += 1
+            self._cond.notify_all()
+
+            while True:
+                if self._queue[0][1] is request:
+                    if self.limiter is None or self.limiter.try_acquire(cost):
+                        break
+                    self._cond.wait(max(self.limiter.time_until(cost), 0.001))
+                else:
+                    self._cond.wait()
+
+            heapq.heappop(self._queue)
+            self._queued[priority] -= 1
+            self._virtual[priority] = max(self._virtual[priority], request.start)
+            if not self._queued[priority]:
+                # Idle class: virtual time catches up with the furthest
+                # finish tag, so every caller starts level again
+                self._virtual[priority] = max(
+                    [self._virtual[priority]] + [finish for key, finish in self._finish.items() if key[0] == priority]
+                )
+            waited = time.monotonic() - request.queued_at
+            self.dispatched[priority] += 1
+            if not self._queued[priority] or self.dispatched[priority] % PRUNE_EVERY == 0:
+                self._prune(priority)
+            self.waited[priority] += waited
+            self.max_wait[priority] = max(self.max_wait[priority], waited)
+            self._cond.notify_all()
+        return waited
+
+    def try_acquire(self, cost: float = 1.0) -> bool:
+        """
+        Take a slot for the calling thread only if one is free right now
+
+        Never waits and never jumps ahead of queued requests. The slot is
+        charged to the caller's fair share like one taken with `acquire`
+        (used for hedged duplicates of a request already sent).
+        """
+        priority, caller, weight = getattr(self._local, 'context', None) or ('normal', None, 1.0)
+        if caller is None:
+            caller = threading.current_thread().name
+
+        with self._cond:
+            if self._queue or (self.limiter is not None and not self.limiter.try_acquire(cost)):
+                return False
+            start = max(self._virtual[priority], self._finish.get((priority, caller), 0.0))
+            self._finish[(priority, caller)] = start + cost / weight
+            self.dispatched[priority] += 1
+        return True
+
+    def _prune(self, priority: str) -> None:
+        """
+        Forget the finish tags of `priority` callers that the class' virtual
+        time has passed; they no longer change any start tag
+        """
+        virtual = self._virtual[priority]
+        for key in [key for key, finish in self._finish.items() if key[0] == priority and finish <= virtual]:
+            del self._finish[key]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            priority: {
+                'dispatched': self.dispatched[priority],
+                'mean_wait': self.waited[priority] / self.dispatched[priority] if self.dispatched[priority] else 0.0,
+                'max_wait': self.max_wait[priority],
+                'queued': self._queued[priority],
+            }
+            for priority in PRIORITIES
+        }
@@ -0,0 +1,70 @@
+"""
+Coalescing of identical concurrent calls
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+__all__ = ["SingleFlight"]
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time and share its result
+
+    While a call for `key` is in flight, every other caller of the same key
+    waits for it and gets the same result (or exception) instead of doing
+    the work again. Callers receive the very same result object, so they
+    must not mutate it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Calls made, and how many of them shared another call's request
+        """
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'executed': self.calls - self.shared,
+        }
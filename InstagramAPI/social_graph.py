@@ -0,0 +1,207 @@
+"""
+Array-backed follower/following graph
+
+Relations are kept in CSR form: per relation a sorted array of owner pks, an
+`indptr` array and the concatenated neighbour pks, each owner's slice sorted
+and unique. The arrays are saved as .npy files and memory mapped when loaded,
+so set queries (mutual followers, who doesn't follow back, overlap between
+many accounts) run as vectorized operations on int64 arrays.
+
+Requires numpy.
+"""
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["GraphBuilder", "SocialGraph", "RELATIONS"]
+
+RELATIONS = ('followers', 'followings')
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("numpy is required for the social graph: pip install numpy")
+
+
+class GraphBuilder:
+    """
+    Collect follower/following lists and write them as a SocialGraph
+
+    Example:
+        builder = GraphBuilder()
+        builder.fetch(api, user_id, 'followers')
+        builder.add_jsonl('competitors.jsonl', 'followers')  # FollowerCrawler output
+        graph = builder.save('graph')
+    """
+
+    def __init__(self) -> None:
+        _require_numpy()
+        self._lists: Dict[str, Dict[int, List[Any]]] = {relation: {} for relation in RELATIONS}
+
+    def add(self, owner, relation: str, pks: Iterable) -> None:
+        """
+        Add `pks` to the `relation` list of `owner`
+        """
+        pks = np.fromiter((int(pk) for pk in pks), dtype=np.int64)
+        self._lists[relation].setdefault(int(owner), []).append(pks)
+
+    def add_users(self, owner, relation: str, users: Iterable[Dict[str, Any]]) -> None:
+        self.add(owner, relation, (user['pk'] for user in users))
+
+    def add_jsonl(self, path: str, relation: str) -> None:
+        """
+        Add the {"target": ..., "user": {...}} lines written by JSONLinesSink
+        """
+        batch: Dict[int, List[int]] = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                batch.setdefault(int(record['target']), []).append(record['user']['pk'])
+        for owner, pks in batch.items():
+            self.add(owner, relation, pks)
+
+    def fetch(self, client, owner, relation: str = 'followers', max_pages: Optional[int] = None) -> None:
+        """
+        Page through the `relation` list of `owner` with a logged-in client
+        """
+        from .crawler import iter_relation_pages
+        for users in iter_relation_pages(client, owner, relation, max_pages):
+            self.add_users(owner, relation, users)
+
+    def save(self, directory: str) -> 'SocialGraph':
+        """
+        Write the CSR arrays to `directory` and open them
+        """
+        os.makedirs(directory, exist_ok=True)
+        for relation, lists in self._lists.items():
+            owners = np.array(sorted(lists), dtype=np.int64)
+            neighbours = [np.unique(np.concatenate(lists[owner])) for owner in owners.tolist()]
+            indptr = np.zeros(len(owners) + 1, dtype=np.int64)
+            np.cumsum([len(n) for n in neighbours], out=indptr[1:])
+            indices = np.concatenate(neighbours) if neighbours else np.zeros(0, dtype=np.int64)
+            np.save(os.path.join(directory, f'{relation}.owners.npy'), owners)
+            np.save(os.path.join(directory, f'{relation}.indptr.npy'), indptr)
+            np.save(os.path.join(directory, f'{relation}.indices.npy'), indices)
+        return SocialGraph(directory)
+
+
+class SocialGraph:
+    """
+    Memory mapped follower/following graph written by GraphBuilder
+
+    Every query returns a sorted int64 array of pks (or counts), computed
+    without turning the lists into Python objects.
+
+    Args:
+        directory: str Directory GraphBuilder.save wrote to
+
+    Example:
+        graph = SocialGraph('graph')
+        graph.not_following_back(my_pk)
+        graph.mutual(a, b)
+        graph.overlap_matrix(competitor_pks)
+    """
+
+    def __init__(self, directory: str) -> None:
+        _require_numpy()
+        self.directory = directory
+        self._owners = {}
+        self._indptr = {}
+        self._indices = {}
+        for relation in RELATIONS:
+            prefix = os.path.join(directory, relation)
+            if not os.path.exists(f'{prefix}.owners.npy'):
+                continue
+            self._owners[relation] = np.load(f'{prefix}.owners.npy', mmap_mode='r')
+            self._indptr[relation] = np.load(f'{prefix}.indptr.npy', mmap_mode='r')
+            self._indices[relation] = np.load(f'{prefix}.indices.npy', mmap_mode='r')
+
+    def owners(self, relation: str = 'followers'):
+        return self._owners[relation]
+
+    def edges(self, relation: str = 'followers') -> int:
+        return len(self._indices[relation])
+
+    def neighbours(self, owner, relation: str = 'followers'):
+        """
+        Sorted pks in the `relation` list of `owner`, empty if unknown
+        """
+        owners = self._owners[relation]
+        position = int(np.searchsorted(owners, int(owner)))
+        if position == len(owners) or owners[position] != int(owner):
+            return np.zeros(0, dtype=np.int64)
+        indptr = self._indptr[relation]
+        return self._indices[relation][indptr[position]:indptr[position + 1]]
+
+    def followers(self, owner):
+        return self.neighbours(owner, 'followers')
+
+    def followings(self, owner):
+        return self.neighbours(owner, 'followings')
+
+    def intersection(self, a, b, relation: str = 'followers'):
+        return np.intersect1d(self.neighbours(a, relation), self.neighbours(b, relation), assume_unique=True)
+
+    def difference(self, a, b, relation: str = 'followers'):
+        """
+        Pks in the `relation` list of `a` but not in that of `b`
+        """
+        return np.setdiff1d(self.neighbours(a, relation), self.neighbours(b, relation), assume_unique=True)
+
+    def mutual(self, a, b):
+        """
+        Users following both `a` and `b`
+        """
+        return self.intersection(a, b, 'followers')
+
+    def not_following_back(self, owner):
+        """
+        Users `owner` follows who do not follow `owner`
+        """
+        return np.setdiff1d(self.followings(owner), self.followers(owner), assume_unique=True)
+
+    def fans(self, owner):
+        """
+        Users following `owner` that `owner` does not follow
+        """
+        return np.setdiff1d(self.followers(owner), self.followings(owner), assume_unique=True)
+
+    def overlap_matrix(self, owners: Sequence, relation: str = 'followers'):
+        """
+        Matrix of shared `relation` list sizes between every pair of `owners`
+
+        The diagonal holds the list sizes. All lists are merged into one
+        sorted array; a pk shared by several owners then appears in a run of
+        equal values, and every pair of positions inside a run counts one
+        overlap between their owners.
+        """
+        lists = [self.neighbours(owner, relation) for owner in owners]
+        size = len(lists)
+        overlap = np.zeros(size * size, dtype=np.int64)
+        if not size:
+            return overlap.reshape(size, size)
+        pks = np.concatenate(lists)
+        rows = np.repeat(np.arange(size, dtype=np.int64), [len(neighbours) for neighbours in lists])
+        # The lists are sorted runs already, which the stable sort merges cheaply
+        order = np.argsort(pks, kind='stable')
+        pks, rows = pks[order], rows[order]
+
+        # Positions whose pk equals the one `distance` further on; this set
+        # only shrinks as the distance grows
+        candidates = np.arange(len(pks) - 1)
+        distance = 1
+        while len(candidates):
+            candidates = candidates[pks[candidates] == pks[candidates + distance]]
+            overlap += np.bincount(rows[candidates] * size + rows[candidates + distance], minlength=size * size)
+            distance += 1
+            candidates = candidates[candidates + distance < len(pks)]
+
+        overlap = overlap.reshape(size, size)
+        overlap += overlap.T
+        overlap[np.diag_indices(size)] = [len(neighbours) for neighbours in lists]
+        return overlap
@@ -0,0 +1,180 @@
+"""
+Client side typeahead index for the search endpoints
+
+Users, hashtags and places are collected from search responses and from
+every feed response the client sees, and kept in sorted key arrays. A search
+for a prefix is answered locally when the same query, or a shorter prefix
+whose results were complete (`has_more` false), was searched within the TTL;
+anything else goes to the endpoint.
+"""
+import bisect
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+__all__ = ["TypeaheadIndex", "KINDS", "local_response", "search_ids"]
+
+KINDS = ('users', 'tags', 'places')
+
+HASHTAG = re.compile(r'#(\w+)')
+
+
+class _Kind:
+    def __init__(self) -> None:
+        self.entries: Dict[Any, Dict[str, Any]] = {}
+        self.keys: List[Tuple[str, Any]] = []
+        self.pending: List[Tuple[str, Any]] = []
+        self.known_keys = set()
+        # query: (searched at, ids in server order, complete)
+        self.searches: Dict[str, Tuple[float, List[Any], bool]] = {}
+
+    def add(self, entry_id, entry: Dict[str, Any], keys) -> None:
+        self.entries[entry_id] = dict(self.entries.get(entry_id, {}), **entry)
+        for key in keys:
+            if key and (key, entry_id) not in self.known_keys:
+                self.known_keys.add((key, entry_id))
+                self.pending.append((key, entry_id))
+
+    def prefix_ids(self, prefix: str) -> List[Any]:
+        if self.pending:
+            self.keys = sorted(self.keys + self.pending)
+            self.pending = []
+        ids = {}
+        position = bisect.bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and self.keys[position][0].startswith(prefix):
+            ids.setdefault(self.keys[position][1], None)
+            position += 1
+        return list(ids)
+
+
+class TypeaheadIndex:
+    """
+    Prefix index of users, hashtags and places seen by a client
+
+    Args:
+        ttl: float Seconds a search keeps answering queries locally
+
+    Example:
+        api.set_typeahead_index(TypeaheadIndex(ttl=600))
+        api.search_users('pyth')    # network, complete
+        api.search_users('pytho')   # local
+        api.search_users('python')  # local
+    """
+
+    def __init__(self, ttl: float = 3600.0) -> None:
+        self.ttl = ttl
+        self.kinds = {kind: _Kind() for kind in KINDS}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _add_user(self, user: Dict[str, Any]) -> None:
+        keys = [user['username'].lower()]
+        keys.extend(word.lower() for word in (user.get('full_name') or '').split())
+        entry = {field: user[field] for field in ('pk', 'username', 'full_name', 'profile_pic_url', 'is_private', 'is_verified') if field in user}
+        self.kinds['users'].add(user['pk'], entry, keys)
+
+    def _add_tag(self, tag: Dict[str, Any]) -> None:
+        name = tag['name'].lower()
+        self.kinds['tags'].add(name, tag, [name])
+
+    def _add_place(self, location: Dict[str, Any]) -> None:
+        keys = [word.lower() for word in location['name'].split()]
+        keys.append(location['name'].lower())
+        self.kinds['places'].add(location['pk'], location, keys)
+
+    def record_response(self, data: Any) -> None:
+        """
+        Add every user, hashtag and place found in a decoded API response
+        """
+        with self._lock:
+            stack = [data]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, list):
+                    stack.extend(value)
+                    continue
+                if not isinstance(value, dict):
+                    continue
+                if isinstance(value.get('username'), str) and value.get('pk') is not None:
+                    self._add_user(value)
+                elif isinstance(value.get('name'), str) and 'media_count' in value:
+                    self._add_tag(value)
+                location = value.get('location')
+                if isinstance(location, dict) and location.get('pk') is not None and isinstance(location.get('name'), str):
+                    self._add_place(location)
+                caption = value.get('caption')
+                if isinstance(caption, dict) and isinstance(caption.get('text'), str):
+                    for name in HASHTAG.findall(caption['text']):
+                        self.kinds['tags'].add(name.lower(), {'name': name.lower()}, [name.lower()])
+                stack.extend(value.values())
+
+    def record_search(self, kind: str, query: str, ids: List[Any], complete: bool) -> None:
+        """
+        Remember the results of a network search for `query`
+
+        Args:
+            kind: str One of KINDS
+            ids: List Result ids (user pk, tag name, place pk) in server order
+            complete: bool The server returned every match (has_more false)
+        """
+        with self._lock:
+            self.kinds[kind].searches[query.lower().strip()] = (time.time(), ids, complete)
+
+    def lookup(self, kind: str, query: str, limit: int = 50) -> Optional[List[Dict[str, Any]]]:
+        """
+        Local results for `query`, None when the index has no fresh coverage
+        """
+        query = query.lower().strip()
+        index = self.kinds[kind]
+        now = time.time()
+        with self._lock:
+            search = index.searches.get(query)
+            if search is not None and now - search[0] < self.ttl:
+                self.hits += 1
+                return [dict(index.entries[i]) for i in search[1] if i in index.entries][:limit]
+
+            for length in range(len(query) - 1, 0, -1):
+                search = index.searches.get(query[:length])
+                if search is None or not search[2] or now - search[0] >= self.ttl:
+                    continue
+                # Server order of the covering search first, entries seen elsewhere after
+                rank = {entry_id: position for position, entry_id in enumerate(search[1])}
+                ids = sorted(index.prefix_ids(query), key=lambda entry_id: rank.get(entry_id, len(rank)))
+                self.hits += 1
+                return [dict(index.entries[i]) for i in ids[:limit]]
+
+            self.misses += 1
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            **{kind: len(index.entries) for kind, index in self.kinds.items()},
+        }
+
+
+def search_ids(kind: str, data: Dict[str, Any]) -> List[Any]:
+    """
+    Result ids, in server order, of a users/tags/places search response
+    """
+    if kind == 'users':
+        return [user['pk'] for user in data.get('users', [])]
+    if kind == 'tags':
+        return [tag['name'].lower() for tag in data.get('results', [])]
+    return [item['location']['pk'] for item in data.get('items', []) if 'location' in item]
+
+
+def local_response(kind: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Search response of the endpoint for `kind`, built from index entries
+    """
+    if kind == 'users':
+        data = {'users': entries, 'num_results': len(entries)}
+    elif kind == 'tags':
+        data = {'results': entries}
+    else:
+        data = {'items': [{'location': entry, 'title': entry.get('name')} for entry in entries]}
+    return dict(data, has_more=False, status='ok')
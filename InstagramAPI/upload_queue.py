@@ -0,0 +1,310 @@
+"""
+Persistent bulk upload queue
+
+Every file of a manifest is validated and probed up front in a process pool
+(format, dimensions, aspect ratio, video duration) and hashed, so bad files
+fail immediately instead of halfway through a run and files that were already
+uploaded are skipped. Queue state lives in sqlite and survives restarts;
+unchanged files are not probed again.
+"""
+import concurrent.futures
+import functools
+import logging
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Optional, Union
+
+from .image_utils import (
+    MAX_ASPECT_RATIO,
+    MIN_ASPECT_RATIO,
+    file_sha256,
+    get_image_size,
+    normalize_image
+)
+from .rate_limit import RateLimiter
+
+__all__ = ["UploadQueue", "probe_media"]
+
+IMAGE_TYPES = (".jpg", ".jpeg", ".gif", ".png", ".bmp")
+VIDEO_TYPES = (".mov", ".mp4")
+
+MIN_VIDEO_DURATION = 3.0
+MAX_VIDEO_DURATION = 60.0
+
+
+def probe_media(
+        path: str,
+        normalize_dir: Optional[str] = None,
+        quality: int = 87
+    ) -> Dict[str, Any]:
+    """
+    Hash, identify and validate one media file
+
+    Returns a dict with `sha256`, `kind`, `width`, `height`, `duration`,
+    `upload_path` and `error`, which is None when the file can be uploaded.
+    With `normalize_dir`, photos are converted by `normalize_image` first and
+    the normalized JPEG is what gets validated and uploaded. Runs in worker
+    processes, so it must stay a module level function.
+    """
+    result = {
+        'sha256': None, 'kind': None, 'width': None, 'height': None,
+        'duration': None, 'upload_path': path, 'error': None,
+    }
+    try:
+        result['sha256'] = file_sha256(path)
+        lower_path = path.lower()
+        if lower_path.endswith(IMAGE_TYPES):
+            result['kind'] = 'photo'
+            if normalize_dir is not None:
+                result['upload_path'] = normalize_image(
+                    path, normalize_dir, quality, sha256=result['sha256']
+                )
+            result['width'], result['height'] = get_image_size(result['upload_path'])
+        elif lower_path.endswith(VIDEO_TYPES):
+            result['kind'] = 'video'
+            from moviepy.editor import VideoFileClip
+            clip = VideoFileClip(path)
+            try:
+                result['width'], result['height'] = clip.size
+                result['duration'] = clip.duration
+            finally:
+                clip.close()
+            if not MIN_VIDEO_DURATION <= result['duration'] <= MAX_VIDEO_DURATION:
+                result['error'] = (
+                    f"Video is {result['duration']:.1f}s, Instagram requires "
+                    f"{MIN_VIDEO_DURATION:.0f}-{MAX_VIDEO_DURATION:.0f}s"
+                )
+                return result
+        else:
+            result['error'] = f'Valid media types are {IMAGE_TYPES} and {VIDEO_TYPES}'
+            return result
+
+        aspect_ratio = result['width'] / result['height']
+        if not MIN_ASPECT_RATIO <= aspect_ratio <= MAX_ASPECT_RATIO:
+            result['error'] = (
+                f'Aspect ratio {aspect_ratio:.2f} is outside of '
+                f'{MIN_ASPECT_RATIO:.2f}-{MAX_ASPECT_RATIO:.2f}'
+            )
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+class UploadQueue:
+    """
+    Validate a whole manifest up front, then upload it at a steady pace
+
+    Item status is one of:
+        ready      validated, waiting for upload
+        invalid    failed validation, see `error`
+        duplicate  same content as a file already uploaded or queued
+        uploaded   done
+        failed     upload request failed, see `error`
+
+    Args:
+        client: InstagramAPI Logged-in client
+        state_path: str sqlite file holding the queue state
+        limiter: RateLimiter pacing the uploads. Defaults to one every 15 minutes
+        normalize_dir: str Convert photos with `normalize_image` into this
+                       directory before uploading them (requires Pillow)
+        quality: int JPEG quality of normalized photos
+
+    Example:
+        queue = UploadQueue(api, 'uploads.db')
+        queue.prepare(['a.jpg', {'path': 'b.mp4', 'thumbnail': 'b.jpg'}],
+                      caption='#hashtag')
+        queue.drain()
+    """
+
+    def __init__(
+            self,
+            client,
+            state_path: str,
+            limiter: Optional[RateLimiter] = None,
+            normalize_dir: Optional[str] = None,
+            quality: int = 87
+        ) -> None:
+        self.client = client
+        self.limiter = limiter or RateLimiter(rate=1 / 900)
+        self.normalize_dir = normalize_dir
+        self.quality = quality
+        self.db = sqlite3.connect(state_path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha256 TEXT, '
+            'kind TEXT, width INTEGER, height INTEGER, duration REAL, '
+            'caption TEXT, thumbnail TEXT, status TEXT, error TEXT, uploaded_at REAL, '
+            'upload_path TEXT)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256)')
+        self.db.commit()
+
+    def prepare(
+            self,
+            manifest: Iterable[Union[str, Dict[str, Any]]],
+            caption: Optional[str] = None,
+            processes: Optional[int] = None
+        ) -> Dict[str, int]:
+        """
+        Add files to the queue, probing every new or changed one in parallel
+
+        Args:
+            manifest: Paths, or dicts with 'path' and optional 'caption' and
+                      'thumbnail' (required for videos)
+            caption: str Caption for entries that do not have their own
+            processes: int Size of the probing process pool
+
+        Returns the number of queued items per status
+        """
+        entries = []
+        for entry in manifest:
+            if isinstance(entry, str):
+                entry = {'path': entry}
+            entry = dict(entry, path=os.path.abspath(entry['path']))
+            entry.setdefault('caption', caption)
+            entries.append(entry)
+
+        known = {
+            path: ((size, mtime), sha256, status)
+            for path, size, mtime, sha256, status
+            in self.db.execute('SELECT path, size, mtime, sha256, status FROM media')
+        }
+        to_probe = []
+        for entry in entries:
+            try:
+                stat = os.stat(entry['path'])
+            except OSError as e:
+                entry['stat'] = (None, None)
+                entry['probe'] = {'error': f'{type(e).__name__}: {e}'}
+                to_probe.append(entry)
+                continue
+            entry['stat'] = (stat.st_size, stat.st_mtime)
+            if entry['path'] not in known or known[entry['path']][0] != entry['stat']:
+                to_probe.append(entry)
+            else:
+                self.db.execute(
+                    'UPDATE media SET caption = ?, thumbnail = ? WHERE path = ?',
+                    (entry['caption'], entry.get('thumbnail'), entry['path'])
+                )
+
+        paths = [entry['path'] for entry in to_probe if 'probe' not in entry]
+        if paths:
+            chunksize = max(1, len(paths) // ((processes or os.cpu_count() or 1) * 4))
+            with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+                probe = functools.partial(
+                    probe_media, normalize_dir=self.normalize_dir, quality=self.quality
+                )
+                probes = dict(zip(paths, pool.map(probe, paths, chunksize=chunksize)))
+            for entry in to_probe:
+                entry.setdefault('probe', probes.get(entry['path']))
+
+        for entry in to_probe:
+            probe = dict(
+                {
+                    'sha256': None, 'kind': None, 'width': None, 'height': None,
+                    'duration': None, 'upload_path': entry['path'],
+                },
+                **entry['probe']
+            )
+            status = 'invalid' if probe['error'] else 'ready'
+            if status == 'ready' and probe['kind'] == 'video' and not entry.get('thumbnail'):
+                status, probe['error'] = 'invalid', 'Videos need a thumbnail'
+            previous = known.get(entry['path'])
+            if previous and previous[1:] == (probe['sha256'], 'uploaded'):
+                # Touched but unchanged since it was uploaded
+                status = 'uploaded'
+            elif status == 'ready' and self._is_duplicate(entry['path'], probe['sha256']):
+                status = 'duplicate'
+            self.db.execute(
+                'INSERT INTO media (path, size, mtime, sha256, kind, width, height, duration, '
+                'caption, thumbnail, status, error, upload_path) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, '
+                'sha256 = excluded.sha256, kind = excluded.kind, width = excluded.width, '
+                'height = excluded.height, duration = excluded.duration, '
+                'caption = excluded.caption, thumbnail = excluded.thumbnail, '
+                'status = excluded.status, error = excluded.error, '
+                'upload_path = excluded.upload_path',
+                (
+                    entry['path'], entry['stat'][0], entry['stat'][1], probe['sha256'],
+                    probe['kind'], probe['width'], probe['height'], probe['duration'],
+                    entry['caption'], entry.get('thumbnail'), status, probe['error'],
+                    probe['upload_path']
+                )
+            )
+        self.db.commit()
+        return self.counts()
+
+    def _is_duplicate(self, path: str, sha256: str) -> bool:
+        row = self.db.execute(
+            "SELECT 1 FROM media WHERE sha256 = ? AND path != ? "
+            "AND status IN ('ready', 'uploaded', 'failed') LIMIT 1",
+            (sha256, path)
+        ).fetchone()
+        return row is not None
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM media GROUP BY status'))
+
+    def retry_failed(self) -> int:
+        """
+        Put failed uploads back in the queue, returns how many
+        """
+        cursor = self.db.execute("UPDATE media SET status = 'ready', error = NULL WHERE status = 'failed'")
+        self.db.commit()
+        return cursor.rowcount
+
+    def drain(self, jitter: float = 0.0, stop=None) -> Dict[str, int]:
+        """
+        Upload every ready item, paced by the rate limiter
+
+        State is committed after every upload, so an interrupted drain picks
+        up where it stopped.
+
+        Args:
+            jitter: float Up to this many extra seconds of random delay per upload
+            stop: Optional threading.Event ending the drain once set
+        """
+        while not (stop is not None and stop.is_set()):
+            row = self.db.execute(
+                "SELECT path, kind, width, height, caption, thumbnail, upload_path FROM media "
+                "WHERE status = 'ready' ORDER BY rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            path, kind, width, height, caption, thumbnail, upload_path = row
+            upload_path = upload_path or path
+
+            self.limiter.acquire()
+            if jitter:
+                time.sleep(random.uniform(0, jitter))
+
+            error = None
+            try:
+                if kind == 'photo':
+                    ok = self.client.upload_photo(upload_path, caption=caption, size=(width, height))
+                else:
+                    ok = self.client.upload_video(upload_path, thumbnail, caption=caption)
+                if not ok:
+                    error = 'Upload request failed'
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+
+            if error is None:
+                self.db.execute(
+                    "UPDATE media SET status = 'uploaded', uploaded_at = ?, error = NULL WHERE path = ?",
+                    (time.time(), path)
+                )
+                logging.info(f"Uploaded {path}")
+            else:
+                self.db.execute(
+                    "UPDATE media SET status = 'failed', error = ? WHERE path = ?", (error, path)
+                )
+                logging.warning(f"Upload of {path} failed: {error}")
+            self.db.commit()
+        return self.counts()
+
+    def close(self) -> None:
+        self.db.close()
@@ -0,0 +1,175 @@
+"""
+Persistent username -> pk index
+
+Friendship and feed endpoints take numeric pks while most inputs are
+usernames. The index remembers every username/pk pair it is shown, including
+the ones found in follower, feed and comment responses when it is attached to
+a client, so most lookups never hit the network.
+"""
+import concurrent.futures
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+__all__ = ["UsernameIndex", "iter_user_pairs"]
+
+
+def iter_user_pairs(data: Any) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (username, pk) for every user object nested anywhere in `data`
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            username = value.get('username')
+            pk = value.get('pk')
+            if isinstance(username, str) and pk is not None:
+                yield username, pk
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+
+
+class UsernameIndex:
+    """
+    Username -> pk mapping kept in sqlite, with an in-memory copy
+
+    Usernames are case-insensitive and stored lowercased. Writes are
+    committed at most every `commit_interval` seconds, and by `flush`/`close`.
+
+    Args:
+        path: str sqlite database file (':memory:' for a throwaway index)
+        commit_interval: float Seconds between commits of recorded pairs
+
+    Example:
+        api.set_username_index(UsernameIndex('usernames.db'))
+        pks = api.resolve_usernames(['instagram', 'python'])
+    """
+
+    def __init__(self, path: str, commit_interval: float = 5.0) -> None:
+        self.commit_interval = commit_interval
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS usernames '
+            '(username TEXT PRIMARY KEY, pk, updated REAL)'
+        )
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._pks: Dict[str, Any] = dict(self.db.execute('SELECT username, pk FROM usernames'))
+        self._dirty = False
+        self._committed_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.resolved = 0
+        self.recorded = 0
+
+    def __len__(self) -> int:
+        return len(self._pks)
+
+    def get(self, username: str) -> Optional[Any]:
+        return self._pks.get(username.lower())
+
+    def record(self, pairs: Iterable[Tuple[str, Any]]) -> int:
+        """
+        Store (username, pk) pairs, returns how many were new or changed
+        """
+        changed = []
+        with self._lock:
+            for username, pk in pairs:
+                username = username.lower()
+                if self._pks.get(username) != pk:
+                    self._pks[username] = pk
+                    changed.append((username, pk, time.time()))
+            if changed:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO usernames (username, pk, updated) VALUES (?, ?, ?)',
+                    changed
+                )
+                self._dirty = True
+                self.recorded += len(changed)
+            if self._dirty and time.monotonic() - self._committed_at >= self.commit_interval:
+                self._commit()
+        return len(changed)
+
+    def _commit(self) -> None:
+        self.db.commit()
+        self._dirty = False
+        self._committed_at = time.monotonic()
+
+    def flush(self) -> None:
+        """
+        Commit the pairs recorded since the last commit
+        """
+        with self._lock:
+            if self._dirty:
+                self._commit()
+
+    def record_response(self, data: Any) -> int:
+        """
+        Store every user object found in a decoded API response
+        """
+        return self.record(iter_user_pairs(data))
+
+    def resolve(self, client, usernames: Iterable[str], workers: int = 8) -> Dict[str, Any]:
+        """
+        Map usernames to pks, looking up the unknown ones concurrently
+
+        Args:
+            client: InstagramAPI Logged-in client used for the misses
+            usernames: Iterable[str] Usernames to resolve
+            workers: int Lookups in flight at once
+
+        Returns {username: pk} in input order. Usernames that could not be
+        resolved (renamed, deleted, request failed) are left out.
+        """
+        names = list(dict.fromkeys(usernames))
+        result: Dict[str, Any] = {}
+        missing = []
+        for name in names:
+            pk = self._pks.get(name.lower())
+            if pk is None:
+                missing.append(name)
+            else:
+                result[name] = pk
+        self.hits += len(result)
+        self.misses += len(missing)
+
+        def lookup(name: str) -> Optional[Any]:
+            try:
+                if not client.search_username(name):
+                    return None
+                user = client.last_json.get('user') or {}
+            except Exception as e:
+                logging.warning(f"Failed to resolve {name}: {e}")
+                return None
+            pk = user.get('pk')
+            if pk is not None:
+                self.record([(user.get('username') or name, pk)])
+            return pk
+
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                for name, pk in zip(missing, pool.map(lookup, missing)):
+                    if pk is None:
+                        logging.warning(f"Could not resolve username {name}")
+                    else:
+                        result[name] = pk
+                        self.resolved += 1
+        return {name: result[name] for name in names if name in result}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._pks),
+            'hits': self.hits,
+            'misses': self.misses,
+            'resolved': self.resolved,
+            'recorded': self.recorded,
+        }
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
@@ -0,0 +1,185 @@
+"""
+Event driven watcher for the direct inbox and the activity feed
+
+Polls `direct_v2/inbox/` and `news/inbox/`, each on its own interval that
+drops to `min_interval` when something happens and backs off towards
+`max_interval` while the feed stays idle. Only changes are dispatched: a
+thread whose `last_activity_at` moved, an activity story with an unseen pk.
+"""
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+__all__ = ["InboxWatcher", "WatchEvent"]
+
+
+class WatchEvent(NamedTuple):
+    kind: str  # 'thread' or 'activity'
+    key: str  # thread id or story pk
+    data: Dict[str, Any]
+
+
+class _Feed:
+    def __init__(self, kind: str, fetch: Callable[[], bool], interval: float) -> None:
+        self.kind = kind
+        self.fetch = fetch
+        self.interval = interval
+        self.next_poll = 0.0
+        self.polls = 0
+        self.events = 0
+
+
+class InboxWatcher:
+    """
+    Poll inbox and activity adaptively and dispatch only new events
+
+    The first poll of each feed only records the current state, nothing
+    from before the watcher started is dispatched.
+
+    Args:
+        client: InstagramAPI Logged-in client
+        min_interval: float Seconds between polls of a busy feed
+        max_interval: float Seconds between polls of an idle feed
+        backoff: float Factor the interval grows by after an idle poll
+        remember: int Activity story pks remembered to detect new ones
+
+    Example:
+        watcher = InboxWatcher(api)
+        watcher.on_event(lambda event: print(event.kind, event.key))
+        watcher.start()
+        ...
+        watcher.stop()
+    """
+
+    def __init__(
+            self,
+            client,
+            min_interval: float = 5.0,
+            max_interval: float = 300.0,
+            backoff: float = 1.5,
+            remember: int = 10_000
+        ) -> None:
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.feeds = [
+            _Feed('thread', client.get_v2_inbox, min_interval),
+            _Feed('activity', client.get_recent_activity, min_interval),
+        ]
+        self._threads: Optional[Dict[str, Any]] = None
+        self._stories: Optional[collections.OrderedDict] = None
+        self._remember = remember
+        self._callbacks: List[Callable[[WatchEvent], Any]] = []
+        self._queues: List = []
+        self._stop = threading.Event()
+        self._runner = None
+
+    def on_event(self, callback: Callable[[WatchEvent], Any]) -> None:
+        """
+        Call `callback(event)` for every new event, from the watcher thread
+        """
+        self._callbacks.append(callback)
+
+    def attach_queue(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Put every new event on an asyncio queue owned by `loop`
+        """
+        self._queues.append((queue, loop))
+
+    def _thread_events(self, data: Dict[str, Any]) -> List[WatchEvent]:
+        threads = (data.get('inbox') or {}).get('threads', [])
+        current = {str(thread['thread_id']): thread.get('last_activity_at') or 0 for thread in threads}
+        known, self._threads = self._threads, dict(self._threads or {}, **current)
+        if known is None:
+            return []
+        return [
+            WatchEvent('thread', str(thread['thread_id']), thread)
+            for thread in threads
+            if current[str(thread['thread_id'])] > known.get(str(thread['thread_id']), 0)
+        ]
+
+    def _activity_events(self, data: Dict[str, Any]) -> List[WatchEvent]:
+        stories = (data.get('new_stories') or []) + (data.get('old_stories') or [])
+        priming = self._stories is None
+        if priming:
+            self._stories = collections.OrderedDict()
+        events = []
+        for story in stories:
+            pk = str(story.get('pk') or story.get('story_id') or '')
+            if not pk or pk in self._stories:
+                continue
+            self._stories[pk] = None
+            if not priming:
+                events.append(WatchEvent('activity', pk, story))
+        while len(self._stories) > self._remember:
+            self._stories.popitem(last=False)
+        return events
+
+    def _dispatch(self, event: WatchEvent) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.warning(f"Watcher callback failed on {event.kind} {event.key}: {e}")
+        for queue, loop in self._queues:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def poll(self, feed: _Feed) -> List[WatchEvent]:
+        """
+        Poll one feed now, dispatch its new events and reschedule it
+        """
+        feed.polls += 1
+        if not feed.fetch():
+            events = []
+        elif feed.kind == 'thread':
+            events = self._thread_events(self.client.last_json)
+        else:
+            events = self._activity_events(self.client.last_json)
+        for event in events:
+            self._dispatch(event)
+        feed.events += len(events)
+
+        if events:
+            feed.interval = self.min_interval
+        else:
+            feed.interval = min(self.max_interval, feed.interval * self.backoff)
+        feed.next_poll = time.monotonic() + feed.interval
+        return events
+
+    def run(self) -> None:
+        """
+        Poll until `stop` is called, always picking the feed due first
+        """
+        while not self._stop.is_set():
+            feed = min(self.feeds, key=lambda feed: feed.next_poll)
+            if self._stop.wait(max(0.0, feed.next_poll - time.monotonic())):
+                return
+            try:
+                self.poll(feed)
+            except Exception as e:
+                logging.warning(f"Watcher poll of {feed.kind} failed: {e}")
+                feed.interval = min(self.max_interval, feed.interval * self.backoff)
+                feed.next_poll = time.monotonic() + feed.interval
+
+    def start(self) -> None:
+        """
+        Run the watcher in a daemon thread
+        """
+        if self._runner is not None and self._runner.is_alive():
+            return
+        self._stop.clear()
+        self._runner = threading.Thread(target=self.run, daemon=True)
+        self._runner.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            feed.kind: {'polls': feed.polls, 'events': feed.events, 'interval': feed.interval}
+            for feed in self.feeds
+        }
@@ -4,31 +4,28 @@
 # Use text editor to edit the script and type in valid Instagram username/password
 
 import os
-import time
-import random
 from os import listdir
 from os.path import isfile, join
-from random import randint
-from InstagramAPI import InstagramAPI
+from InstagramAPI.instagram_api import InstagramAPI
+from InstagramAPI.rate_limit import RateLimiter
+from InstagramAPI.upload_queue import UploadQueue
 
-PhotoPath = "~/igphoto/"  # Change Directory to Folder with Pics that you want to upload
+PhotoPath = os.path.expanduser("~/igphoto/")  # Change Directory to Folder with Pics that you want to upload
 # Change to your Photo Hashtag
 IGCaption = "Your Caption Here #hashtag"
 
-os.chdir(PhotoPath)
-ListFiles = [f for f in listdir(PhotoPath) if isfile(join(PhotoPath, f))]
-print("Total Photo in this folder:" + str(len(ListFiles)))
+if __name__ == "__main__":
+    ListFiles = [join(PhotoPath, f) for f in listdir(PhotoPath)
+                 if isfile(join(PhotoPath, f)) and f != "uploads.db"]
+    print("Total Photo in this folder:" + str(len(ListFiles)))
 
-# Start Login and Uploading Photo
-igapi = InstagramAPI("login", "password")
-igapi.login()  # login
+    # Start Login and Uploading Photo
+    igapi = InstagramAPI("login", "password")
+    igapi.login()  # login
 
-for i in range(len(ListFiles)):
-    photo = ListFiles[i]
-    print("Progress :" + str([i + 1]) + " of " + str(len(ListFiles)))
-    print("Now Uploading this photo to instagram: " + photo)
-    igapi.uploadPhoto(photo, caption=IGCaption, upload_id=None)
-    # sleep for random between 600 - 1200s
-    n = randint(600, 1200)
-    print("Sleep upload for seconds: " + str(n))
-    time.sleep(n)
+    # One upload every 10 minutes, plus up to 10 minutes of random delay.
+    # Queue state is kept in uploads.db, so the script can be restarted at
+    # any time without uploading anything twice.
+    queue = UploadQueue(igapi, join(PhotoPath, "uploads.db"), RateLimiter(rate=1 / 600))
+    print("Validated:", queue.prepare(ListFiles, caption=IGCaption))
+    print("Finished:", queue.drain(jitter=600))
@@ -2,44 +2,33 @@
 # -*- coding: utf-8 -*-
 #
 # Use text editor to edit the script and type in valid Instagram username/password
-# 
+#
 # example delete_media
 # this example for how to delete self media feed
-# have 2 parameter on method deleteMedia( MediaID, MediaType)
+# deleted media ids are kept in deleted.txt, run it again to resume
 
-from InstagramAPI import InstagramAPI 
+from InstagramAPI.bulk_media import delete_media_many
+from InstagramAPI.instagram_api import InstagramAPI
+from InstagramAPI.rate_limit import RateLimiter
 
 # change this username & password
 username = 'your_username_here'
 password = 'your_password_here'
 
-ig = InstagramAPI(username, password) 
-
-# login 
-ig.login() 
-
-# get Self user feed 
-ig.getSelfUserFeed()
-
-# get response json and assignment value to MediaList Variable
-# dict type data 
-MediaList = ig.LastJson 
-
-# get first media for example delete media
-Media = MediaList['items'][0]
-
-# get media ID 
+ig = InstagramAPI(username, password)
 
-MediaID = Media['id']
-MediaType = Media['media_type']
+# login
+ig.login()
 
-# call deleteMedia Method
-# deleteMedia return BOOL {true|false} 
-isDeleted = ig.deleteMedia(MediaID, media_type=MediaType)
+# delete every media of the self user feed, pages are fetched while deleting
+job = delete_media_many(
+    ig,
+    checkpoint_path='deleted.txt',
+    workers=4,
+    limiter=RateLimiter(rate=1, burst=4),
+    on_result=lambda result: print(result.media_id, 'deleted' if result.ok else result.error)
+)
 
-if isDeleted:
-    print("Your Media {0} has been deleted".format(
-        MediaID
-    ))
-else:
-    print("Your Media Not Deleted")
+print(job.stats())
+for failure in job.failures:
+    print("Your Media {0} has not been deleted: {1}".format(failure.media_id, failure.error))
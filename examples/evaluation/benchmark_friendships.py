@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Friendship status for many users: per-user loop against show_many.
+#
+# A local stub answers friendships/show/{id}/ and friendships/show_many/
+# after LATENCY seconds, like a round-trip to the API would take.
+
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from InstagramAPI.instagram_api import InstagramAPI
+
+USERS = 1000
+LATENCY = 0.02
+
+
+def status(user_id):
+    return {'following': user_id % 2 == 0, 'followed_by': user_id % 3 == 0, 'is_private': False}
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(LATENCY)
+        StubHandler.requests += 1
+        if self.path.endswith('/show_many/'):
+            ids = urllib.parse.parse_qs(body.decode())['user_ids'][0].split(',')
+            data = {'friendship_statuses': {i: status(int(i)) for i in ids}, 'status': 'ok'}
+        else:
+            data = dict(status(int(self.path.rstrip('/').rsplit('/', 1)[1])), status='ok')
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def make_client(port):
+    api = InstagramAPI('benchmark', 'benchmark')
+    api.API_URL = f'http://127.0.0.1:{port}/api/v1/'
+    api.is_logged_in = True
+    api.username_id = '1'
+    api.token = 'token'
+    return api
+
+
+def measure(name, function):
+    StubHandler.requests = 0
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    print(f'{name:<28} {elapsed:8.2f} s {StubHandler.requests:6d} requests {len(result):6d} users')
+    return result
+
+
+if __name__ == "__main__":
+    server = Server(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = make_client(server.server_address[1])
+    user_ids = list(range(1, USERS + 1))
+
+    def loop():
+        result = {}
+        for user_id in user_ids:
+            api.user_friendship(user_id)
+            result[user_id] = api.last_json
+        return result
+
+    looped = measure('user_friendship loop', loop)
+    bulk = measure('user_friendships', lambda: api.user_friendships(user_ids))
+    assert all(bulk[user_id].following == looped[user_id]['following'] for user_id in user_ids)
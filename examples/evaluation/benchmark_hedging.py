@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Tail latency of GET requests with and without hedging.
+#
+# A local server answers in 10 ms, except for 2% of requests which take
+# 500 ms (a stalled connection or an overloaded backend). The same requests
+# are sent once each, then through a Hedger that sends a duplicate after
+# the p95 latency with a 5% budget.
+
+import http.server
+import random
+import socketserver
+import threading
+import time
+
+import requests
+
+from InstagramAPI.hedging import Hedger
+
+REQUESTS = 1000
+SLOW_RATIO = 0.02
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.5 if random.random() < SLOW_RATIO else 0.01)
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 for p in (50, 95, 99, 99.9)}
+
+
+def run(name, send):
+    latencies = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        send()
+        latencies.append(time.perf_counter() - started)
+    summary = '  '.join(f'p{p}: {ms:6.1f} ms' for p, ms in percentiles(latencies).items())
+    print(f'{name:<10} {summary}  total {sum(latencies):5.1f} s')
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    headers = {'Connection': 'close'}
+
+    run('plain', lambda: requests.get(url, headers=headers).content)
+
+    hedger = Hedger(percentile=95, budget=0.05)
+    run('hedged', lambda: hedger.call(
+        lambda: requests.get(url, headers=headers, stream=True),
+        lambda: requests.get(url, headers=headers, stream=True),
+        ok=lambda response: response.status_code < 500,
+        discard=lambda response: response.close(),
+    ).content)
+    print(hedger.stats())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Decode-time benchmark for large synthetic follower pages.
+# Compares the old `json.loads(response.text)` path with bytes decoding
+# (orjson when installed) and incremental decoding with JSONArrayStream.
+
+import json
+import random
+import string
+import time
+
+from InstagramAPI.json_stream import JSONArrayStream, loads, orjson
+
+
+def make_page(n_users):
+    def word(n):
+        return ''.join(random.choice(string.ascii_lowercase) for _ in range(n))
+
+    users = [
+        {
+            'pk': random.randint(10 ** 8, 10 ** 10),
+            'username': word(12),
+            'full_name': f'{word(6).title()} "{word(8)}" \\ {word(5)}',
+            'is_private': random.random() < 0.3,
+            'profile_pic_url': f'https://scontent.cdninstagram.com/{word(40)}.jpg',
+            'profile_pic_id': f'{random.randint(10 ** 17, 10 ** 18)}_{random.randint(1, 10 ** 9)}',
+            'is_verified': False,
+            'has_anonymous_profile_picture': False,
+            'latest_reel_media': random.randint(0, 1_600_000_000),
+        }
+        for _ in range(n_users)
+    ]
+    return json.dumps({
+        'sections': None,
+        'users': users,
+        'big_list': True,
+        'next_max_id': word(20),
+        'page_size': n_users,
+        'status': 'ok',
+    }).encode()
+
+
+def chunked(body, size=65536):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def bench(name, function, body, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(body)
+        best = min(best, time.perf_counter() - start)
+    print(f'{name:<32} {best * 1000:9.2f} ms')
+
+
+def decode_text(body):
+    # What send_request used to do: bytes -> str -> objects
+    return json.loads(body.decode('utf-8'))
+
+
+def decode_stream(body):
+    stream = JSONArrayStream(chunked(body), 'users')
+    count = sum(1 for _ in stream)
+    assert stream.envelope['next_max_id']
+    return count
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    print('orjson:', 'available' if orjson is not None else 'not installed')
+    for n_users in (200, 10_000, 100_000):
+        body = make_page(n_users)
+        print()
+        print(f'{n_users} users, {len(body) / 1e6:.1f} MB')
+        bench('json.loads(response.text)', decode_text, body)
+        bench('loads(response.content)', loads, body)
+        bench('JSONArrayStream', decode_stream, body)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Cost of the response models against plain `last_json` dict access.
+#
+# Feed pages shaped like response_example.json (a `ranked_items` list of
+# media with user, caption and preview comments) are run through two
+# common pipelines, once reading the decoded dicts directly and once through
+# Page/Media/Comment/User. Both start from the same decoded pages, since the
+# models wrap the decoded payload and do not change decoding. The models
+# created are counted and the peak allocated memory is measured with
+# tracemalloc.
+#
+# The models are several times slower than the dicts here and allocate a
+# wrapper per object visited: they do not reduce allocations, which is why
+# the client's own paging reads last_json directly.
+
+import copy
+import json
+import os
+import time
+import tracemalloc
+
+from InstagramAPI.models import Model, Page
+
+PAGES = 50
+ITEMS = 100
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', '..', 'response_example.json')
+
+
+def make_pages():
+    with open(EXAMPLE, encoding='utf-8') as f:
+        media = json.load(f)['ranked_items'][0]
+    pages = []
+    for page in range(PAGES):
+        items = []
+        for i in range(ITEMS):
+            item = copy.deepcopy(media)
+            item['pk'] += page * ITEMS + i
+            items.append(item)
+        pages.append({'ranked_items': items, 'more_available': True, 'next_max_id': str(page), 'status': 'ok'})
+    return pages
+
+
+def engagement_dicts(pages):
+    """
+    (pk, like_count, comment_count) of every media
+    """
+    rows = []
+    for page in pages:
+        rows.extend((media['pk'], media.get('like_count', 0), media.get('comment_count', 0)) for media in page['ranked_items'])
+    return rows
+
+
+def engagement_models(pages):
+    rows = []
+    for data in pages:
+        rows.extend((media.pk, media.like_count, media.comment_count) for media in Page(data))
+    return rows
+
+
+def commenters_dicts(pages):
+    """
+    Usernames of the preview commenters of every media
+    """
+    names = set()
+    for page in pages:
+        for media in page['ranked_items']:
+            names.update(comment['user']['username'] for comment in media.get('comments', []))
+    return names
+
+
+def commenters_models(pages):
+    names = set()
+    for data in pages:
+        for media in Page(data):
+            names.update(comment.user.username for comment in media.comments)
+    return names
+
+
+def measure(pipeline, pages):
+    """
+    Models created and peak traced memory of one run
+    """
+    created = [0]
+    init = Model.__init__
+
+    def counting_init(self, data):
+        created[0] += 1
+        init(self, data)
+
+    Model.__init__ = counting_init
+    tracemalloc.start()
+    try:
+        pipeline(pages)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        Model.__init__ = init
+    return created[0], peak
+
+
+if __name__ == "__main__":
+    pages = make_pages()
+    print(f'{PAGES} pages x {ITEMS} media')
+    for pipeline in (engagement_dicts, engagement_models, commenters_dicts, commenters_models):
+        created, peak = measure(pipeline, pages)
+        started = time.perf_counter()
+        pipeline(pages)
+        seconds = time.perf_counter() - started
+        print(f'{pipeline.__name__:<20} {created:8,} models  peak {peak / 1024:8.1f} KiB  {seconds * 1000:7.1f} ms')
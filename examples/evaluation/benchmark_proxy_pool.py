@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Throughput under proxy failure, with local simulated proxies.
+#
+# Three proxies run on localhost: "fast" dies halfway through the run,
+# "slow" answers after 300 ms and "backup" is fast and stays up. A single
+# fixed proxy (what set_proxy does) is compared with a ProxyPool.
+
+import http.server
+import socketserver
+import threading
+import time
+
+import requests
+
+from InstagramAPI.proxy_pool import ProxyPool
+
+DURATION = 6.0
+THREADS = 8
+TARGET_URL = 'http://i.instagram.com/api/v1/'
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    delay = 0.0
+    failing = None  # threading.Event, set once the proxy should start failing
+
+    def do_GET(self):
+        if self.failing is not None and self.failing.is_set():
+            # Drop the connection like a dead upstream would
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        time.sleep(self.delay)
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_proxy(name, delay, failing=None):
+    handler = type(name, (ProxyHandler,), {'delay': delay, 'failing': failing})
+    server = Server(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def run(select, report):
+    """
+    Send requests from THREADS threads for DURATION seconds
+
+    Returns successful requests per second in the first and second half
+    """
+    halves = [0, 0]
+    started = time.monotonic()
+
+    def worker(account):
+        session = requests.Session()
+        while True:
+            now = time.monotonic() - started
+            if now > DURATION:
+                return
+            proxy = select(account)
+            sent = time.monotonic()
+            try:
+                response = session.get(TARGET_URL, proxies={'http': proxy}, timeout=2)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            report(proxy, time.monotonic() - sent, ok)
+            if ok:
+                halves[now > DURATION / 2] += 1
+
+    threads = [threading.Thread(target=worker, args=(f'account{i}',)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [count / (DURATION / 2) for count in halves]
+
+
+def scenario(name, make_strategy):
+    failing = threading.Event()
+    fast = start_proxy('Fast', 0.01, failing)
+    slow = start_proxy('Slow', 0.3)
+    backup = start_proxy('Backup', 0.01)
+    select, report = make_strategy([fast, slow, backup])
+    timer = threading.Timer(DURATION / 2, failing.set)
+    timer.start()
+    before, after = run(select, report)
+    timer.cancel()
+    print(f'{name:<20} {before:8.1f} req/s before failure {after:8.1f} req/s after')
+
+
+def fixed_proxy(proxies):
+    return (lambda account: proxies[0]), (lambda proxy, latency, ok: None)
+
+
+def proxy_pool(proxies):
+    pool = ProxyPool(proxies, request_timeout=2)
+    return pool.select, pool.report
+
+
+if __name__ == "__main__":
+    scenario('fixed proxy', fixed_proxy)
+    scenario('ProxyPool', proxy_pool)
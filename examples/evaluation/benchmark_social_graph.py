@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Size and query latency of SocialGraph against Python sets.
+#
+# 200 synthetic accounts with 100,000 followers each (20M edges) drawn from
+# a shared pool of 5M users, so the lists overlap like competitor audiences.
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from InstagramAPI.social_graph import GraphBuilder, SocialGraph
+
+ACCOUNTS = 200
+FOLLOWERS = 100_000
+POOL = 5_000_000
+
+
+def timed(function, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    pool = rng.choice(10 ** 12, POOL, replace=False)
+    lists = {owner: pool[rng.integers(0, POOL, FOLLOWERS)] for owner in range(1, ACCOUNTS + 1)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        builder = GraphBuilder()
+        for owner, pks in lists.items():
+            builder.add(owner, 'followers', pks)
+            builder.add(owner, 'followings', pks[:FOLLOWERS // 10])
+        _, build_seconds = timed(lambda: builder.save(directory))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        graph = SocialGraph(directory)
+        print(f'build {build_seconds:.2f} s, {graph.edges():,} follower edges, {size / 2 ** 20:.0f} MB on disk')
+
+        _, seconds = timed(lambda: graph.mutual(1, 2), 100)
+        print(f'mutual(a, b)              {seconds * 1000:8.2f} ms')
+        _, seconds = timed(lambda: graph.not_following_back(1), 100)
+        print(f'not_following_back(a)     {seconds * 1000:8.2f} ms')
+        _, seconds = timed(lambda: graph.overlap_matrix(range(1, ACCOUNTS + 1)))
+        print(f'overlap_matrix(200)       {seconds * 1000:8.2f} ms')
+
+        sets = {owner: set(pks.tolist()) for owner, pks in lists.items()}
+        _, seconds = timed(lambda: sets[1] & sets[2], 100)
+        print(f'set mutual(a, b)          {seconds * 1000:8.2f} ms')
+        _, seconds = timed(lambda: [[len(sets[a] & sets[b]) for b in range(1, 21)] for a in range(1, 21)])
+        print(f'set overlap (20 of 200)   {seconds * 1000:8.2f} ms')
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A request that raises on one proxy is retried through another one.
+#
+# Two proxies run on localhost. Whichever is asked first drops the
+# connection once, then both answer normally. send_request goes through a
+# ProxyPool, so the failing proxy stays the account's sticky proxy (one
+# failure does not evict it), and the retry must still use the other proxy.
+
+import http.server
+import socketserver
+import threading
+
+from InstagramAPI.instagram_api import InstagramAPI
+from InstagramAPI.proxy_pool import ProxyPool
+
+ROUNDS = 20
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    name = ''
+    seen = None  # list of the names of the proxies asked, shared by both
+    drop_next = None  # threading.Event, set while the next request must fail
+
+    def do_GET(self):
+        self.seen.append(self.name)
+        if self.drop_next.is_set():
+            self.drop_next.clear()
+            # Drop the connection like a dead upstream would
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_proxy(name, seen, drop_next):
+    handler = type(name, (ProxyHandler,), {'name': name, 'seen': seen, 'drop_next': drop_next})
+    server = Server(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+if __name__ == "__main__":
+    seen = []
+    drop_next = threading.Event()
+    proxies = [start_proxy('first', seen, drop_next), start_proxy('second', seen, drop_next)]
+
+    api = InstagramAPI("username", "password")
+    api.API_URL = 'http://i.instagram.com/api/v1/'
+    api.is_logged_in = True
+
+    for _ in range(ROUNDS):
+        # A fresh pool every round, so earlier failures never evict a proxy
+        api.set_proxy_pool(ProxyPool(proxies, request_timeout=2))
+        del seen[:]
+        drop_next.set()
+        assert api.send_request('feed/timeline/'), api.last_response.status_code
+        failed, retried = seen
+        assert retried != failed, f'retried through the proxy that failed: {seen}'
+    print(f'{ROUNDS} failed requests retried through the other proxy')
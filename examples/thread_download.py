@@ -4,7 +4,8 @@
 # Use text editor to edit the script and type in valid Instagram username/password
 
 import json
-from InstagramAPI import InstagramAPI
+from InstagramAPI.exceptions import RequestFailedException
+from InstagramAPI.instagram_api import InstagramAPI
 
 
 class DownloadThread():
@@ -12,47 +13,33 @@ class DownloadThread():
         self.client = client
 
         self.thread = thread_id
-        self.newest_cursor = None
-        self.oldest_cursor = None
         self.users = {}
         self.conversation = []
 
     def init_owner(self):
-        if not self.client.getProfileData():
+        if not self.client.get_profile_data():
             print("Failed!\n")
 
-        user = self.client.LastJson.get('user')
+        user = self.client.last_json.get('user')
         self._add_user(user)
 
-    def _request(self):
-        return self.client.getv2Threads(thread_id, self.oldest_cursor)
-
-    def _download(self):
-        if self.oldest_cursor is not None:
-            self._request()
-            self._save()
-
-    def _save(self):
-        data = self.client.LastJson.get('thread')
-        self.conversation = data['items'][::-1] + self.conversation
-        self.oldest_cursor = data.get('oldest_cursor')
-        self.newest_cursor = data.get('newest_cursor')
-        self._download()
-
     def add_users(self, users):
         for user in users:
             self._add_user(user)
 
     def _add_user(self, user):
-        self.users[user['pk']] = {'full_name': user['pk'], 'username': user['username']}
+        self.users[user['pk']] = {'full_name': user.get('full_name'), 'username': user['username']}
 
     def download(self):
-        if not self._request():
-            print("Failed!\n")
-
-        data = self.client.LastJson.get('thread')
-        self.add_users(data['users'])
-        self._save()
+        # Pages come newest first, reverse once at the end
+        items = []
+        try:
+            for _, page in self.client.iter_thread_pages(self.thread):
+                self.add_users(page.get('users', []))
+                items.extend(page.get('items', []))
+        except (RuntimeError, RequestFailedException) as e:
+            print(f"Failed! {e}\n")
+        self.conversation = items[::-1]
 
     def save(self):
         dump = json.dumps(self.conversation)
@@ -69,3 +56,6 @@ if __name__ == "__main__":
     inst = DownloadThread(InstagramAPI, thread_id)
     inst.download()
     inst.save()
+
+    # Large inboxes: stream every thread to its own JSON lines file instead,
+    # resumable with ThreadExporter(InstagramAPI, 'inbox_export').export()